@@ -0,0 +1,261 @@
+# Data Visualization Project - NADIRE Nada
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, urlencode
+from categories import decode
+from cube import slice_cube, age_bucket_label, CUBE_DIMENSIONS, AGE_BUCKET_WIDTH, AGE_BUCKET_MAX
+from dico import dico_mapping
+from exports import build_export, EXPORT_FORMATS
+from refresh import served_dataset, default_selection
+from result_cache import cached_result, cache_stats
+from schema import MISSING_CODE, OTHER_CODE, MISSING_DEPARTMENT
+from tracing import span
+
+
+# Local HTTP/JSON query service of the accident breakdowns : the same cuboids as the dashboard
+# (load_cuboid of viz_project.py, so the service started in the Streamlit server shares its caches)
+# GET /aggregate?group_by=catr,mois&catr=3,4&lum=1&years=2022 -> counts of people per group
+# GET /dimensions -> the dimensions and their codes (dico.py), GET /stats -> the hit rates of the result cache
+# GET /export?format=csv.gz&catr=3&years=2022 -> export of the rows (exports.py), streamed from its file
+# The encoded answers are kept in the result cache shared with the sessions of the dashboard (result_cache.py).
+# The answers carry an ETag (dataset version + query), a client sending it back in If-None-Match gets a 304.
+# Usage : python api.py --port 8502
+
+DEFAULT_PORT = 8502
+# Size of the blocks of an export file sent to the client
+EXPORT_BLOCK_SIZE = 1024 * 1024
+# Mime type of each export format (file extension)
+EXPORT_MIME_TYPES = dict(EXPORT_FORMATS.values())
+# Environment variable that starts the service inside the Streamlit server (viz_project.py)
+PORT_VARIABLE = "ACCIDENTS_API_PORT"
+
+
+# Error of a query (answered with a 400)
+class QueryError(ValueError):
+    pass
+
+
+# Function returning the valid codes of a dimension (text codes for the departments, integers for the others)
+def dimension_codes(dim):
+    if dim == "age_bucket":
+        return list(range(0, AGE_BUCKET_MAX + 1, AGE_BUCKET_WIDTH)) + [MISSING_CODE]
+    if dim == "dep":
+        return list(dico_mapping[dim]) + [MISSING_DEPARTMENT]
+    return list(dico_mapping[dim]) + [MISSING_CODE, OTHER_CODE]
+
+
+# Function returning the labels of the codes of a dimension
+def dimension_labels(codes, dim):
+    if dim == "age_bucket":
+        return [age_bucket_label(code) for code in codes]
+    return list(decode(codes, dim))
+
+
+# Function to parse an integer code
+def parse_code(dim, value):
+    try:
+        return int(value)
+    except ValueError:
+        raise QueryError(f"the codes of '{dim}' are integers, not {value!r}") from None
+
+
+# Function to parse a list of codes of a filter ("3,4"), checked against the codes of dico.py
+def parse_codes(dim, text):
+    valid = dimension_codes(dim)
+    codes = []
+    for value in text.split(","):
+        code = value.strip() if dim == "dep" else parse_code(dim, value)
+        if code not in valid:
+            raise QueryError(f"unknown code {value!r} for '{dim}'")
+        codes.append(code)
+    return tuple(sorted(set(codes)))
+
+
+# Function to parse the query string into a canonical query : (years, group_by, ((dim, codes), ...))
+def parse_query(query_string):
+    params = {name: values[-1] for name, values in parse_qs(query_string, keep_blank_values=True).items()}
+    group_by = tuple(dim for dim in params.pop("group_by", "").split(",") if dim)
+    years = params.pop("years", "")
+    try:
+        years = tuple(sorted(int(year) for year in years.split(",") if year)) or default_selection()
+    except ValueError:
+        raise QueryError(f"years must be integers, not {years!r}") from None
+    for dim in group_by + tuple(params):
+        if dim not in CUBE_DIMENSIONS:
+            raise QueryError(f"unknown dimension '{dim}' (dimensions : {', '.join(CUBE_DIMENSIONS)})")
+    filters = tuple(sorted((dim, parse_codes(dim, text)) for dim, text in params.items()))
+    return years, group_by, filters
+
+
+# Function returning the ETag of a query on a dataset version (known without computing the answer)
+def query_etag(dataset, group_by, filters):
+    key = json.dumps([dataset.years, dataset.version, group_by, filters])
+    return '"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+
+
+# Function computing the answer of a query on a dataset version, with the cuboid of its dimensions
+def aggregate(load_cuboid, dataset, group_by, filters):
+    dimensions = tuple(dict.fromkeys(group_by + tuple(dim for dim, _ in filters)))
+    # A query without dimension is the total count, read from a small cuboid
+    cuboid = load_cuboid(dimensions or ("grav",), dataset)
+    counts = slice_cube(cuboid, group_by, {dim: list(codes) for dim, codes in filters})
+    if not group_by:
+        rows = [{"count": int(counts.iloc[0])}]
+    else:
+        counts = counts.reset_index()
+        columns = {}
+        for dim in group_by:
+            codes = counts[dim].tolist()
+            columns[dim] = [str(code) for code in codes] if dim == "dep" else [int(code) for code in codes]
+            columns[f"{dim}_label"] = dimension_labels(counts[dim].to_numpy(), dim)
+        columns["count"] = [int(count) for count in counts["count"]]
+        rows = [dict(zip(columns, values)) for values in zip(*columns.values())]
+    return {
+        "dataset": {"years": list(dataset.years), "version": dataset.version},
+        "group_by": list(group_by),
+        "filters": {dim: list(codes) for dim, codes in filters},
+        "rows": rows,
+    }
+
+
+# Function returning the handler class of the service, answering with the cuboids of load_cuboid
+# The encoded answers are kept in the result cache, keyed by the dataset version and the canonical query
+def make_handler(load_cuboid):
+
+    def encoded_answer(dataset, group_by, filters):
+        with span("api.aggregate") as record:
+            answer = aggregate(load_cuboid, dataset, group_by, filters)
+            record["rows"] = len(answer["rows"])
+        # allow_nan=False : a NaN is not valid JSON, no answer is sent with one
+        return json.dumps(answer, ensure_ascii=False, allow_nan=False).encode("utf-8")
+
+    def cached_answer(dataset, group_by, filters):
+        return cached_result("api", (dataset, group_by, filters), lambda: encoded_answer(dataset, group_by, filters))
+
+    class QueryHandler(BaseHTTPRequestHandler):
+        # Keep-alive connections (every answer has a Content-Length), the headers and the body are sent
+        # without waiting for the acknowledgement of the previous packet (TCP_NODELAY)
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            try:
+                if url.path == "/aggregate":
+                    self.send_aggregate(url.query)
+                elif url.path == "/export":
+                    self.send_export(url.query)
+                elif url.path == "/dimensions":
+                    self.send_json(200, {dim: dict(zip(map(str, dimension_codes(dim)),
+                                                       dimension_labels(dimension_codes(dim), dim)))
+                                         for dim in CUBE_DIMENSIONS})
+                elif url.path == "/stats":
+                    self.send_json(200, cache_stats())
+                else:
+                    self.send_json(404, {"error": f"unknown path {url.path}"})
+            except QueryError as error:
+                self.send_json(400, {"error": str(error)})
+
+        def send_aggregate(self, query_string):
+            years, group_by, filters = parse_query(query_string)
+            dataset = self.dataset(years)
+            etag = query_etag(dataset, group_by, filters)
+            if not self.not_modified(etag):
+                self.send_body(200, cached_answer(dataset, group_by, filters), etag)
+
+        def send_export(self, query_string):
+            params = parse_qs(query_string, keep_blank_values=True)
+            extension = params.pop("format", ["csv.gz"])[-1]
+            if extension not in EXPORT_MIME_TYPES:
+                raise QueryError(f"unknown export format '{extension}' (formats : {', '.join(EXPORT_MIME_TYPES)})")
+            years, group_by, filters = parse_query(urlencode(params, doseq=True))
+            if group_by:
+                raise QueryError("an export has no group_by")
+            dataset = self.dataset(years)
+            etag = query_etag(dataset, ("export", extension), filters)
+            if self.not_modified(etag):
+                return
+            # The export is built once per dataset version, then sent block by block from its file
+            path = build_export(dataset, extension, dict(filters))
+            self.send_response(200)
+            self.send_header("Content-Type", EXPORT_MIME_TYPES[extension])
+            self.send_header("Content-Length", str(os.path.getsize(path)))
+            self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(path)}"')
+            self.send_header("ETag", etag)
+            self.end_headers()
+            with open(path, "rb") as export_file:
+                shutil.copyfileobj(export_file, self.wfile, EXPORT_BLOCK_SIZE)
+
+        def dataset(self, years):
+            try:
+                return served_dataset(years)
+            except FileNotFoundError:
+                raise QueryError(f"years not in the dataset : {list(years)}") from None
+
+        def not_modified(self, etag):
+            # Answers with a 304 if the client sent the current ETag in If-None-Match
+            if etag not in (tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")):
+                return False
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return True
+
+        def send_json(self, status, content):
+            self.send_body(status, json.dumps(content, ensure_ascii=False).encode("utf-8"))
+
+        def send_body(self, status, body, etag=None):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            if etag is not None:
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # The queries are traced (tracing.py) instead of printed
+            pass
+
+    return QueryHandler
+
+
+# Function creating the server of the service (serve_forever answers the queries)
+def make_server(load_cuboid, port=DEFAULT_PORT, host="127.0.0.1"):
+    server = ThreadingHTTPServer((host, port), make_handler(load_cuboid))
+    server.daemon_threads = True
+    return server
+
+
+# Function to start the service in a background thread (inside the Streamlit server)
+def start_server(load_cuboid, port=DEFAULT_PORT, host="127.0.0.1"):
+    server = make_server(load_cuboid, port, host)
+    threading.Thread(target=server.serve_forever, name="api", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP/JSON query service of the accident breakdowns")
+    parser.add_argument("--port", type=int, default=int(os.environ.get(PORT_VARIABLE, DEFAULT_PORT)))
+    parser.add_argument("--host", default="127.0.0.1")
+    args = parser.parse_args(argv)
+    # Same loaders as the dashboard (Streamlit caches in bare mode)
+    from viz_project import load_cuboid
+    server = make_server(load_cuboid, args.port, args.host)
+    print(f"Serving the accident breakdowns on http://{args.host}:{args.port}/aggregate")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
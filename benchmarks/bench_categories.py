@@ -0,0 +1,66 @@
+# Data Visualization Project - NADIRE Nada
+
+# Benchmark of the label decoding : df.replace(dico_mapping) on the whole frame (before)
+# vs grouping on the integer codes and decoding only the aggregated result (after)
+# Usage (from the project directory) : python -m benchmarks.bench_categories [accidents/year=2022/accidents.parquet]
+
+import sys
+import time
+
+import pandas as pd
+
+from categories import decode
+from dico import dico_mapping
+from schema import apply_schema
+from store import partition_path
+
+REPEAT = 5
+GROUPED_COLUMNS = ("catr", "lum", "atm", "catv", "dep")
+
+
+# Function returning the best time of REPEAT calls of func
+def best_time(func):
+    timings = []
+    for _ in range(REPEAT):
+        start_time = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start_time)
+    return min(timings)
+
+
+# Function running the panel-like aggregations on the string-replaced frame
+def aggregate_replaced(df):
+    replaced = df.replace(dico_mapping)
+    return [replaced[column].value_counts() for column in GROUPED_COLUMNS]
+
+
+# Function returning a copy of an aggregated result with the labels of its index
+def decode_index(result, column):
+    result = result.copy()
+    result.index = pd.Index(decode(result.index, column), name=result.index.name)
+    return result
+
+
+# Function running the same aggregations on the codes and decoding only the results
+def aggregate_codes(df):
+    return [decode_index(df[column].value_counts(), column) for column in GROUPED_COLUMNS]
+
+
+# Function printing the memory of both frames and the time of both aggregation paths
+def main(path=partition_path(2022)):
+    raw = pd.read_parquet(path)
+    replaced = raw.replace(dico_mapping)
+    # Compact dtypes of the dashboard (schema.py) : integer codes and the departments as a categorical
+    df = apply_schema(raw.copy())
+
+    frame_mb = df.memory_usage(deep=True).sum() / (1024 * 1024)
+    replaced_mb = replaced.memory_usage(deep=True).sum() / (1024 * 1024)
+    print(f"Memory of the frame : {replaced_mb:.1f} MB with labels, {frame_mb:.1f} MB with codes")
+
+    replaced_time = best_time(lambda: aggregate_replaced(raw))
+    codes_time = best_time(lambda: aggregate_codes(df))
+    print(f"Replace + aggregate : {replaced_time:.3f} s, aggregate codes + decode : {codes_time:.3f} s")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
@@ -0,0 +1,144 @@
+# Data Visualization Project - NADIRE Nada
+
+# Headless benchmark of the exploration page (clean_db.py) and of each panel of the dashboard (viz_project.py)
+# on synthetic files (benchmarks/synthetic.py) at several scale factors. Each scale runs in its own process,
+# with the Streamlit calls in bare mode, and the spans of tracing.py give the time and peak memory of each step.
+# The results are written to a CSV file, and compared with a baseline file to catch regressions.
+# Usage (from the project directory) :
+# python -m benchmarks.bench_dashboard --scales 1 5 10 50 --output results.csv [--baseline previous.csv]
+
+import argparse
+import os
+import subprocess
+import sys
+
+import pandas as pd
+
+from benchmarks.synthetic import generate
+from tracing import TRACE_ENV
+
+DATA_DIR = "benchmark-data"
+YEAR = 2022
+DEFAULT_SCALES = (1, 5, 10, 50)
+
+# Each scale is run in REPEAT processes and the warm page WARM_RUNS times in each, the median time is kept
+REPEAT = 3
+WARM_RUNS = 5
+
+# A step is a regression if it is this much slower (by at least MIN_REGRESSION_MS) or bigger than in the baseline
+REGRESSION_RATIO = 1.25
+MIN_REGRESSION_MS = 50
+
+# Spans of tracing.py kept in the results : the steps of clean_db, the full page, the computation of all
+# the panels (compute_dashboard) and of each panel (panel.monthly, panel.weather..., viz.map for the fragments)
+STEP_PREFIXES = ("clean_db.", "viz.", "compute_dashboard", "panel.")
+
+
+# Function computing the panels of the fragments of the dashboard (departments, map, gravity) with the default
+# values of their widgets : in bare mode the body of a fragment does not run, so viz_project.main() skips them
+def run_fragment_panels(viz_project, dataset):
+    viz_project.departments_panel(dataset, "Accidents", 0, sys.maxsize)
+    if dataset.years:
+        viz_project.map_panel(dataset, viz_project.DEFAULT_RESOLUTION, None, None)
+    viz_project.gravity_panel(dataset, {'catr': None, 'lum': None}, viz_project.usager_types(dataset)[0])
+
+
+# Function running the steps of one scale in the current process (called in a child process)
+# The first run of the page is cold (caches empty), the next ones are warm
+def run_steps(source_dir):
+    project_dir = os.getcwd()
+    sys.path.insert(0, project_dir)
+    os.chdir(source_dir)
+    from tracing import span
+    from ingest import read_sources, merge_tables, write_year
+    from store import dataset_key
+
+    # Exploration page : read and profile the four files, merge them and write the year of the dataset
+    with span("clean_db.read_sources"):
+        tables, _ = read_sources(".", YEAR)
+    with span("clean_db.merge_tables") as record:
+        main_df, _ = merge_tables(*(tables[table][0] for table in ("usagers", "lieux", "caracteristiques", "vehicules")))
+        record["rows"] = len(main_df)
+    with span("clean_db.write_year"):
+        write_year(main_df, YEAR)
+    del tables, main_df
+
+    # Dashboard : the whole page (key numbers and panels), cold then warm
+    import viz_project
+    dataset = dataset_key([YEAR])
+    for run in ["cold"] + ["warm"] * WARM_RUNS:
+        with span(f"viz.main.{run}"):
+            viz_project.main()
+            run_fragment_panels(viz_project, dataset)
+
+
+# Function running one scale in REPEAT child processes and returning the time and peak memory of each step
+def bench_scale(scale, data_dir=DATA_DIR, repeat=REPEAT):
+    source_dir = os.path.abspath(os.path.join(data_dir, f"scale={scale}"))
+    if not os.path.exists(os.path.join(source_dir, f"usagers-{YEAR}.csv")):
+        generate(source_dir, scale, YEAR)
+    trace_path = os.path.join(source_dir, "traces.jsonl")
+    if os.path.exists(trace_path):
+        os.remove(trace_path)
+
+    for _ in range(repeat):
+        subprocess.run([sys.executable, "-m", "benchmarks.bench_dashboard", "--child", source_dir],
+                       env={**os.environ, TRACE_ENV: trace_path},
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    spans = pd.read_json(trace_path, lines=True)
+    steps = spans[spans["span"].str.startswith(STEP_PREFIXES)].groupby("span", sort=False)
+    return pd.DataFrame({
+        "scale": scale,
+        "duration_ms": steps["duration_ms"].median().round(1),
+        "rows": steps["rows"].max(),
+        "peak_memory_mb": steps["peak_memory_mb"].max(),
+    }).rename_axis("step").reset_index()
+
+
+# Function returning the steps that are REGRESSION_RATIO times slower or bigger than in the baseline
+def find_regressions(results, baseline):
+    merged = results.merge(baseline, on=["scale", "step"], suffixes=("", "_baseline"))
+    slower = ((merged["duration_ms"] > merged["duration_ms_baseline"] * REGRESSION_RATIO)
+              & (merged["duration_ms"] - merged["duration_ms_baseline"] > MIN_REGRESSION_MS))
+    bigger = merged["peak_memory_mb"] > merged["peak_memory_mb_baseline"] * REGRESSION_RATIO
+    return merged[slower | bigger][["scale", "step", "duration_ms_baseline", "duration_ms",
+                                    "peak_memory_mb_baseline", "peak_memory_mb"]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless benchmark of clean_db.py and the dashboard panels")
+    parser.add_argument("--scales", nargs="+", type=float, default=DEFAULT_SCALES, help="scale factors of the synthetic data")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="directory of the synthetic files (generated once per scale)")
+    parser.add_argument("--output", default="benchmark-results.csv", help="CSV file of the results")
+    parser.add_argument("--baseline", help="CSV file of previous results to compare with")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="number of processes run for each scale")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_steps(args.child)
+        return
+
+    results = []
+    for scale in args.scales:
+        scale = int(scale) if float(scale).is_integer() else scale
+        print(f"Scale {scale}x ...")
+        results.append(bench_scale(scale, args.data_dir, args.repeat))
+    results = pd.concat(results, ignore_index=True)
+    results.to_csv(args.output, index=False)
+    with pd.option_context("display.width", 160, "display.max_rows", None, "display.max_columns", None):
+        for value in ("duration_ms", "peak_memory_mb"):
+            print(results.pivot_table(index="step", columns="scale", values=value, sort=False).add_prefix(f"{value} "))
+
+    if args.baseline:
+        regressions = find_regressions(results, pd.read_csv(args.baseline))
+        if not regressions.empty:
+            print(f"Regressions (more than x{REGRESSION_RATIO} the baseline) :")
+            print(regressions.to_string(index=False))
+            sys.exit(1)
+        print("No regression against the baseline")
+
+
+if __name__ == '__main__':
+    main()
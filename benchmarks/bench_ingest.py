@@ -0,0 +1,30 @@
+# Data Visualization Project - NADIRE Nada
+
+# Benchmark of the reading of the four source files : one after the other (the serial path of the exploration page)
+# vs a pool of threads and a pool of processes, each worker reading, cleaning and profiling one file
+# Usage (from the project directory) : python -m benchmarks.bench_ingest [source_dir] [year]
+
+import sys
+
+from ingest import read_sources, DEFAULT_WORKERS
+
+REPEAT = 3
+
+
+# Function returning the best time of REPEAT calls of read_sources with the given workers and executor
+def best_time(source_dir, year, workers, executor):
+    return min(read_sources(source_dir, year, workers, executor, profile_dir=None)[1] for _ in range(REPEAT))
+
+
+# Function printing the time of the serial path and the speedup of the thread and process pools
+def main(source_dir=".", year="2022"):
+    year = int(year)
+    serial_time = best_time(source_dir, year, 1, "thread")
+    print(f"{'serial':>8} : {serial_time:.3f} s")
+    for executor in ("thread", "process"):
+        parallel_time = best_time(source_dir, year, DEFAULT_WORKERS, executor)
+        print(f"{executor:>8} : {parallel_time:.3f} s, speedup x{serial_time / parallel_time:.2f}")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:3])
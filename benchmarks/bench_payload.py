@@ -0,0 +1,54 @@
+# Data Visualization Project - NADIRE Nada
+
+# Bytes sent to the browser by the panels of the dashboard at each rerun : the plotly figures are sent as
+# JSON (plotly.io.to_json, as st.plotly_chart does) and the frames of st.bar_chart as Arrow IPC bytes.
+# The time to compute all the panels is measured on the first run and on the next runs (figure cache).
+# Usage (from the project directory, after clean_db.py or ingest.py) : python -m benchmarks.bench_payload [year]
+
+import sys
+import time
+
+import pandas as pd
+import plotly.io as pio
+import pyarrow as pa
+
+RUNS = 5
+
+
+# Function returning the bytes of a chart : JSON of a plotly figure, Arrow IPC of a frame or a series
+def chart_bytes(chart):
+    if isinstance(chart, (pd.DataFrame, pd.Series)):
+        frame = chart.to_frame() if isinstance(chart, pd.Series) else chart
+        sink = pa.BufferOutputStream()
+        table = pa.Table.from_pandas(frame)
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().size
+    return len(pio.to_json(chart, validate=False))
+
+
+def main(year=None):
+    from panels import compute_panels, required_cuboids
+    from store import available_years, dataset_key
+    from viz_project import load_panel_source, load_department_summary
+    dataset = dataset_key([year] if year else available_years()[-1:])
+    filters = {"catr": None, "lum": None, "catu": 1}
+
+    durations = []
+    for _ in range(RUNS):
+        start_time = time.perf_counter()
+        cuboids = {dimensions: load_panel_source(dimensions, dataset) for dimensions in required_cuboids()}
+        results = compute_panels(cuboids, filters)
+        durations.append((time.perf_counter() - start_time) * 1000)
+
+    # The chart of a panel is its figure : the plotly figure, or the compact frame of st.bar_chart
+    sizes = {name: chart_bytes(result.figure) for name, result in results.items()}
+    sizes["departments"] = chart_bytes(load_department_summary(dataset)["accidents"])
+    for name, size in sizes.items():
+        print(f"{name:15} {size:8} bytes")
+    print(f"{'total':15} {sum(sizes.values()):8} bytes per rerun")
+    print(f"panels : first run {durations[0]:.1f} ms, next runs {sorted(durations[1:])[len(durations[1:]) // 2]:.1f} ms")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else None)
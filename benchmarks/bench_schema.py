@@ -0,0 +1,27 @@
+# Data Visualization Project - NADIRE Nada
+
+# Memory of each column of a CSV file read with the dtypes inferred by pandas (before)
+# vs the compact dtypes of schema.py (after)
+# Usage (from the project directory) : python -m benchmarks.bench_schema [accidents.csv]
+
+import sys
+
+import pandas as pd
+
+from ingest import sniff_format
+from schema import read_dtypes, apply_schema, memory_report
+from store import CSV_PATH
+
+
+# Function printing the dtype and the memory of each column before and after the schema
+def main(path=CSV_PATH):
+    encoding, delimiter = sniff_format(path)
+    before = pd.read_csv(path, delimiter=delimiter, encoding=encoding, low_memory=False)
+    after = apply_schema(pd.read_csv(path, delimiter=delimiter, encoding=encoding, low_memory=False,
+                                     dtype=read_dtypes()))
+    with pd.option_context("display.width", 120):
+        print(memory_report(before, after))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
@@ -0,0 +1,96 @@
+# Data Visualization Project - NADIRE Nada
+
+# Memory of the dataset when several server processes hold it : each process loads the columns of the
+# dashboard, either from the shared copy mapped into memory (store.read_dataset) or by reading the Parquet
+# partitions into its own memory. The resident memory (RSS) and the proportional memory (PSS, where the
+# shared pages are divided between the processes that map them) of the processes are summed. (Linux only)
+# Usage (from the project directory, after clean_db.py or ingest.py) :
+# python -m benchmarks.bench_sessions [--processes 1 2 4 8] [--years 2022]
+# The columns of a single year are views of the mapping, the years of a multi-year selection are concatenated
+# once per process.
+
+import argparse
+import subprocess
+import sys
+
+import pandas as pd
+
+DEFAULT_PROCESSES = (1, 2, 4, 8)
+# imports : the process without the dataset, to subtract the memory of Python, pandas and pyarrow
+MODES = ("imports", "parquet", "shared")
+COLUMNS = ("Num_Acc", "grav", "an_nais", "catr", "lum", "dep", "catu", "mois", "agg", "atm", "catv", "sexe", "trajet")
+
+
+# Function to load the dataset in a child process, then hold it until the parent closes stdin
+def hold_dataset(mode, years=None):
+    from store import available_years, read_dataset, partition_path
+    years = years or available_years()
+    if mode == "shared":
+        df = read_dataset(years, COLUMNS)
+    elif mode == "parquet":
+        # Copy of the partitions in the memory of the process (the dashboard before the shared copy)
+        df = pd.concat([pd.read_parquet(partition_path(year), columns=list(COLUMNS)) for year in years],
+                       ignore_index=True)
+    else:
+        df = None
+    # Touch every column, as the dashboard does when it builds its aggregates
+    if df is not None:
+        for column in df.columns:
+            if df[column].dtype.kind in "iu":
+                df[column].to_numpy().sum()
+    print("ready", flush=True)
+    sys.stdin.readline()
+
+
+# Function returning the RSS and PSS of a process in MB
+def process_memory_mb(pid):
+    memory = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in ("Rss", "Pss"):
+                memory[name.lower()] = int(value.split()[0]) / 1024
+    return memory
+
+
+# Function starting n processes holding the dataset and returning their total RSS and PSS in MB
+def measure(mode, n_processes, years=None):
+    command = [sys.executable, "-m", "benchmarks.bench_sessions", "--child", mode]
+    if years:
+        command += ["--years"] + [str(year) for year in years]
+    children = [subprocess.Popen(command,
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                for _ in range(n_processes)]
+    try:
+        for child in children:
+            child.stdout.readline()
+        memory = [process_memory_mb(child.pid) for child in children]
+    finally:
+        for child in children:
+            child.stdin.close()
+            child.wait()
+    return {"mode": mode, "processes": n_processes,
+            "rss_mb": round(sum(m["rss"] for m in memory), 1), "pss_mb": round(sum(m["pss"] for m in memory), 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Memory of the dataset held by several processes")
+    parser.add_argument("--processes", nargs="+", type=int, default=DEFAULT_PROCESSES)
+    parser.add_argument("--years", nargs="+", type=int, help="years of the dataset (default : every year)")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        hold_dataset(args.child, args.years)
+        return
+
+    results = pd.DataFrame([measure(mode, n, args.years) for n in args.processes for mode in MODES])
+    # Memory of the dataset alone : the memory of the processes without the dataset is subtracted
+    imports = results[results["mode"] == "imports"].set_index("processes")[["rss_mb", "pss_mb"]]
+    results = results[results["mode"] != "imports"].set_index(["mode", "processes"])
+    dataset = results - imports.reindex(results.index.get_level_values("processes")).to_numpy()
+    print(dataset.add_prefix("dataset_").join(results).round(1).to_string())
+
+
+if __name__ == '__main__':
+    main()
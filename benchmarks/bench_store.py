@@ -0,0 +1,120 @@
+# Data Visualization Project - NADIRE Nada
+
+# Benchmark of the loading of the accidents dataset : CSV (before) vs Parquet / Arrow IPC (after)
+# Usage (from the project directory) : python -m benchmarks.bench_store [accidents.csv]
+# Each measure runs in a fresh process so that the peak RSS of one load does not hide the next one.
+# "RSS MB" is the resident memory added by the load (measured after the imports of pandas / pyarrow).
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from schema import COORDINATE_COLUMNS, MISSING_CODE
+from store import to_arrow_table, write_parquet, CSV_PATH
+from validation import code_flags, INVALID_CODES
+
+# Columns of the biggest dashboard panel, used to measure column projection
+PROJECTED_COLUMNS = ("Num_Acc", "catr", "mois", "agg", "catv", "sexe", "an_nais")
+REPEAT = 3
+
+
+# Function returning the resident memory of the current process in MB
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+    except FileNotFoundError:
+        # No /proc (macOS) : fall back to the peak resident memory, in bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024)
+
+
+# Function to write the dataset as a compressed Arrow IPC (Feather v2) file
+def write_arrow(df, path, compression="lz4"):
+    feather.write_feather(to_arrow_table(df), path, compression=compression)
+    return path
+
+
+# Function to read a Parquet or Arrow IPC file, loading only the requested columns (column projection)
+def read_store(path, columns=None):
+    columns = list(columns) if columns is not None else None
+    if path.endswith(".arrow"):
+        table = feather.read_table(path, columns=columns)
+    else:
+        table = pq.read_table(path, columns=columns)
+    return table.to_pandas()
+
+
+# Function loading one file in the current process and printing the measures as JSON
+def measure(path, projected):
+    columns = PROJECTED_COLUMNS if projected else None
+    rss_before = rss_mb()
+    start_time = time.perf_counter()
+    if path.endswith(".csv"):
+        usecols = list(columns) if columns is not None else None
+        df = pd.read_csv(path, delimiter=',', low_memory=False, usecols=usecols)
+    else:
+        df = read_store(path, columns)
+    load_time = time.perf_counter() - start_time
+    print(json.dumps({
+        "seconds": load_time,
+        "rss_mb": rss_mb() - rss_before,
+        "frame_mb": df.memory_usage(deep=True).sum() / (1024 * 1024),
+    }))
+
+
+# Function running one measure in a child process
+def run_child(path, projected):
+    command = [sys.executable, "-m", "benchmarks.bench_store", "--child", path, "1" if projected else "0"]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+# Function adding the columns of the schema that accidents.csv (written by the first version of clean_db.py) does not have
+def complete_columns(df):
+    for column in COORDINATE_COLUMNS:
+        if column not in df.columns:
+            df[column] = np.nan
+    for column in ("weekday", "hour"):
+        if column not in df.columns:
+            df[column] = MISSING_CODE
+    if INVALID_CODES not in df.columns:
+        df[INVALID_CODES] = code_flags(df)
+    return df
+
+
+# Function writing the Parquet / Arrow IPC copies of the CSV file and printing the comparison table
+def main(csv_path=CSV_PATH):
+    df = complete_columns(pd.read_csv(csv_path, delimiter=',', low_memory=False))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = {
+            "csv": csv_path,
+            "parquet": write_parquet(df, os.path.join(tmp_dir, "accidents.parquet")),
+            "arrow": write_arrow(df, os.path.join(tmp_dir, "accidents.arrow")),
+        }
+        del df
+
+        print(f"{'format':<10}{'columns':<12}{'size MB':>10}{'load s':>10}{'RSS MB':>10}{'frame MB':>10}")
+        for name, path in files.items():
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            for projected in (False, True):
+                runs = [run_child(path, projected) for _ in range(REPEAT)]
+                best = min(runs, key=lambda run: run["seconds"])
+                label = "projected" if projected else "all"
+                print(f"{name:<10}{label:<12}{size_mb:>10.1f}{best['seconds']:>10.3f}"
+                      f"{best['rss_mb']:>10.1f}{best['frame_mb']:>10.1f}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        measure(sys.argv[2], sys.argv[3] == "1")
+    else:
+        main(*sys.argv[1:2])
@@ -0,0 +1,99 @@
+# Data Visualization Project - NADIRE Nada
+
+# Load test of the query service of api.py : several clients send a mix of /aggregate queries for a fixed
+# duration on keep-alive connections, and the requests per second and latency percentiles are reported.
+# With --revalidate the clients send back the ETag of their previous answer (If-None-Match), as a polling tool would.
+# Usage (from the project directory) :
+# python -m benchmarks.load_api [--url http://127.0.0.1:8502] [--clients 8] [--duration 10] [--revalidate]
+# Without --url, the service is started in this process on the dataset of the current directory.
+
+import argparse
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+# Queries of the mix (the breakdowns of the dashboard panels and a few filtered ones)
+QUERIES = (
+    "group_by=mois&catr=3",
+    "group_by=agg",
+    "group_by=catv&catr=4",
+    "group_by=sexe,age_bucket",
+    "group_by=grav&catu=1",
+    "group_by=atm&lum=5",
+    "group_by=trajet",
+    "group_by=dep",
+    "group_by=catr,lum&grav=2",
+    "catr=3,4&lum=1",
+)
+
+
+# Function run by each client : sends the queries in turn until the end time, records the latency and status
+def run_client(host, port, end_time, revalidate, latencies, statuses, offset):
+    connection = http.client.HTTPConnection(host, port)
+    etags = {}
+    i = offset
+    while time.perf_counter() < end_time:
+        query = QUERIES[i % len(QUERIES)]
+        i += 1
+        headers = {"If-None-Match": etags[query]} if revalidate and query in etags else {}
+        start_time = time.perf_counter()
+        connection.request("GET", f"/aggregate?{query}", headers=headers)
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start_time)
+        statuses.append(response.status)
+        if response.getheader("ETag"):
+            etags[query] = response.getheader("ETag")
+    connection.close()
+
+
+# Function running the load test and returning the requests per second, latency percentiles and statuses
+def load_test(url, clients=8, duration=10, revalidate=False):
+    url = urlsplit(url)
+    latencies, statuses = [], []
+    end_time = time.perf_counter() + duration
+    threads = [threading.Thread(target=run_client, args=(url.hostname, url.port, end_time, revalidate,
+                                                         latencies, statuses, client))
+               for client in range(clients)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start_time
+    latencies = np.array(latencies) * 1000
+    codes, counts = np.unique(statuses, return_counts=True)
+    return {
+        "requests": len(latencies),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+        "statuses": {int(code): int(count) for code, count in zip(codes, counts)},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test of the query service of api.py")
+    parser.add_argument("--url", help="address of a running service (default : started in this process)")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10, help="duration of the test in seconds")
+    parser.add_argument("--revalidate", action="store_true", help="send If-None-Match with the last ETag")
+    args = parser.parse_args(argv)
+
+    url = args.url
+    if url is None:
+        from api import start_server
+        from viz_project import load_cuboid
+        server = start_server(load_cuboid, port=0)
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"{args.clients} clients, {args.duration} s on {url}{' with revalidation' if args.revalidate else ''}")
+    for name, value in load_test(url, args.clients, args.duration, args.revalidate).items():
+        print(f"{name} : {value}")
+
+
+if __name__ == '__main__':
+    main()
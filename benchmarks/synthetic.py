@@ -0,0 +1,176 @@
+# Data Visualization Project - NADIRE Nada
+
+# Generator of synthetic ONISR files (usagers, lieux, caracteristiques, vehicules) with the columns of the
+# 2022 release and the codes of dico.py, at a scale factor of the real 2022 files (1x = about 55 000 accidents)
+# Usage (from the project directory) : python -m benchmarks.synthetic output_dir [scale] [year]
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from dico import dico_mapping
+
+ACCIDENTS_PER_SCALE = 55_000
+VEHICLES_PER_ACCIDENT = 1.7
+USAGERS_PER_VEHICLE = 1.35
+
+# Share of each code in the real files, for the columns where it is far from uniform
+# The other coded columns of dico.py are drawn uniformly among their codes
+CODE_WEIGHTS = {
+    "grav": {1: 0.41, 2: 0.03, 3: 0.16, 4: 0.40},
+    "catu": {1: 0.73, 2: 0.19, 3: 0.08},
+    "sexe": {1: 0.67, 2: 0.32, -1: 0.01},
+    "lum": {1: 0.66, 2: 0.06, 3: 0.07, 4: 0.01, 5: 0.20},
+    "agg": {1: 0.37, 2: 0.63},
+    "atm": {1: 0.80, 2: 0.10, 3: 0.02, 4: 0.01, 5: 0.01, 6: 0.01, 7: 0.01, 8: 0.03, 9: 0.01},
+    "catr": {1: 0.06, 2: 0.05, 3: 0.36, 4: 0.46, 5: 0.01, 6: 0.01, 7: 0.04, 9: 0.01},
+    "surf": {1: 0.79, 2: 0.17, 3: 0.01, 4: 0.005, 5: 0.005, 6: 0.005, 7: 0.005, 8: 0.005, 9: 0.005},
+    "catv": {1: 0.03, 2: 0.04, 7: 0.62, 10: 0.06, 30: 0.02, 31: 0.01, 32: 0.02, 33: 0.09, 34: 0.02,
+             37: 0.01, 50: 0.03, 99: 0.05},
+    "trajet": {-1: 0.02, 0: 0.18, 1: 0.12, 2: 0.02, 3: 0.05, 4: 0.06, 5: 0.40, 9: 0.15},
+}
+
+# Departments : a few large departments concentrate the accidents (weights decrease with the rank)
+LARGE_DEPARTMENTS = ("75", "93", "92", "94", "13", "69", "59", "33", "06", "31")
+
+
+# Function returning the codes and their probabilities for a coded column
+def code_distribution(column):
+    weights = CODE_WEIGHTS.get(column) or {code: 1 for code in dico_mapping[column]}
+    codes = np.array(list(weights))
+    probabilities = np.array(list(weights.values()), dtype=float)
+    return codes, probabilities / probabilities.sum()
+
+
+# Function drawing n codes of a column of dico.py
+def draw_codes(rng, column, n):
+    codes, probabilities = code_distribution(column)
+    return rng.choice(codes, size=n, p=probabilities)
+
+
+# Function drawing n department codes
+def draw_departments(rng, n):
+    departments = list(LARGE_DEPARTMENTS) + [dep for dep in dico_mapping["dep"] if dep not in LARGE_DEPARTMENTS]
+    weights = 1 / np.arange(1, len(departments) + 1) ** 0.8
+    return rng.choice(departments, size=n, p=weights / weights.sum())
+
+
+# Function formatting identifiers the way the ONISR files do ("813 952")
+def format_ids(ids):
+    ids = pd.Series(ids)
+    return (ids // 1000).astype(str) + " " + (ids % 1000).astype(str).str.zfill(3)
+
+
+# Function formatting coordinates with a comma as decimal separator ("48,85661")
+def format_coordinates(values):
+    return pd.Series(np.round(values, 5)).astype(str).str.replace(".", ",", regex=False)
+
+
+# Function generating the four tables of a year, returned as {table: dataframe}
+def generate_tables(scale=1, year=2022, seed=0):
+    rng = np.random.default_rng(seed)
+    n_accidents = max(1, int(ACCIDENTS_PER_SCALE * scale))
+    accident_ids = np.arange(1, n_accidents + 1, dtype=np.int64) + year * 10 ** 8
+
+    caracteristiques = pd.DataFrame({
+        "Accident_Id": accident_ids,
+        "jour": rng.integers(1, 29, n_accidents),
+        "mois": draw_codes(rng, "mois", n_accidents),
+        "an": year,
+        "hrmn": pd.Series(rng.integers(0, 24, n_accidents)).astype(str).str.zfill(2) + ":"
+                + pd.Series(rng.integers(0, 60, n_accidents)).astype(str).str.zfill(2),
+        "lum": draw_codes(rng, "lum", n_accidents),
+        "dep": draw_departments(rng, n_accidents),
+        "com": rng.integers(1000, 99000, n_accidents),
+        "agg": draw_codes(rng, "agg", n_accidents),
+        "int": draw_codes(rng, "int", n_accidents),
+        "atm": draw_codes(rng, "atm", n_accidents),
+        "col": rng.integers(1, 8, n_accidents),
+        "adr": np.where(rng.random(n_accidents) < 0.02, None, "ROUTE NATIONALE"),
+        "lat": format_coordinates(rng.uniform(42.5, 51, n_accidents)),
+        "long": format_coordinates(rng.uniform(-4.5, 8, n_accidents)),
+    })
+
+    # lieux has about 1% of accidents with two places
+    lieux = pd.DataFrame({
+        "Num_Acc": accident_ids,
+        "catr": draw_codes(rng, "catr", n_accidents),
+        "voie": "D1",
+        "v1": 0,
+        "v2": None,
+        "circ": rng.integers(1, 5, n_accidents),
+        "nbv": rng.integers(1, 5, n_accidents),
+        "vosp": 0,
+        "prof": 1,
+        "pr": "(1)",
+        "pr1": "(0)",
+        "plan": 1,
+        "lartpc": None,
+        "larrout": -1,
+        "surf": draw_codes(rng, "surf", n_accidents),
+        "infra": 0,
+        "situ": 1,
+        "vma": rng.choice([30, 50, 70, 80, 90, 110, 130], n_accidents),
+    })
+    lieux = pd.concat([lieux, lieux.sample(frac=0.01, random_state=seed)], ignore_index=True)
+
+    vehicles_per_accident = 1 + rng.poisson(VEHICLES_PER_ACCIDENT - 1, n_accidents)
+    vehicle_accidents = np.repeat(accident_ids, vehicles_per_accident)
+    n_vehicles = len(vehicle_accidents)
+    vehicle_ids = format_ids(np.arange(n_vehicles) + 100_000)
+    vehicules = pd.DataFrame({
+        "Num_Acc": vehicle_accidents,
+        "id_vehicule": vehicle_ids,
+        "num_veh": "A01",
+        "senc": rng.integers(1, 3, n_vehicles),
+        "catv": draw_codes(rng, "catv", n_vehicles),
+        "obs": 0,
+        "obsm": rng.integers(0, 3, n_vehicles),
+        "choc": rng.integers(1, 9, n_vehicles),
+        "manv": rng.integers(1, 27, n_vehicles),
+        "motor": 1,
+        "occutc": None,
+    })
+
+    usagers_per_vehicle = 1 + rng.poisson(USAGERS_PER_VEHICLE - 1, n_vehicles)
+    usager_vehicles = np.repeat(np.arange(n_vehicles), usagers_per_vehicle)
+    n_usagers = len(usager_vehicles)
+    an_nais = rng.integers(year - 95, year - 1, n_usagers).astype(float)
+    an_nais[rng.random(n_usagers) < 0.01] = np.nan
+    usagers = pd.DataFrame({
+        "Num_Acc": vehicle_accidents[usager_vehicles],
+        "id_usager": format_ids(np.arange(n_usagers) + 1_000_000),
+        "id_vehicule": vehicle_ids.to_numpy()[usager_vehicles],
+        "num_veh": "A01",
+        "place": rng.integers(1, 10, n_usagers),
+        "catu": draw_codes(rng, "catu", n_usagers),
+        "grav": draw_codes(rng, "grav", n_usagers),
+        "sexe": draw_codes(rng, "sexe", n_usagers),
+        "an_nais": pd.array(an_nais, dtype="Int16"),
+        "trajet": draw_codes(rng, "trajet", n_usagers),
+        "secu1": rng.integers(0, 9, n_usagers),
+        "secu2": rng.integers(-1, 9, n_usagers),
+        "secu3": -1,
+        "locp": 0,
+        "actp": 0,
+        "etatp": -1,
+    })
+
+    return {"usagers": usagers, "lieux": lieux, "caracteristiques": caracteristiques, "vehicules": vehicules}
+
+
+# Function writing the four synthetic files of a year in output_dir ("usagers-2022.csv", ...)
+def generate(output_dir, scale=1, year=2022, seed=0):
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {}
+    for table, df in generate_tables(scale, year, seed).items():
+        paths[table] = os.path.join(output_dir, f"{table}-{year}.csv")
+        df.to_csv(paths[table], sep=";", index=False)
+    return paths
+
+
+if __name__ == '__main__':
+    output_dir, scale, year = (sys.argv[1:] + [None, None])[:3]
+    generate(output_dir, float(scale or 1), int(year or 2022))
@@ -0,0 +1,55 @@
+# Data Visualization Project - NADIRE Nada
+
+import numpy as np
+import pandas as pd
+from dico import dico_mapping  # Import the dico_mapping from dico.py
+from schema import OTHER_CODE
+from tracing import traced
+
+
+# The dataset keeps the compact codes of the ONISR files : filters and groupings run on the codes,
+# and the labels of dico.py are only attached to the small aggregated results that are plotted.
+
+
+# Function to compile the mapping of one integer coded column into a lookup array (index = code)
+def compile_lookup(mapping):
+    lookup = np.full(max(mapping) + 1, None, dtype=object)
+    for code, label in mapping.items():
+        lookup[code] = label.strip()
+    return lookup
+
+
+# Code-indexed lookup arrays for the integer coded columns (all columns of dico.py except 'dep')
+LABEL_LOOKUPS = {
+    column: compile_lookup(mapping)
+    for column, mapping in dico_mapping.items()
+    if all(isinstance(code, int) for code in mapping)
+}
+
+
+# Label of the group of the codes without a label in dico.py (OTHER_CODE of the cuboids)
+OTHER_LABEL = "Autre"
+
+
+# Function returning the labels of an array of codes (unknown codes such as -1 are kept as text)
+@traced("decode")
+def decode(codes, column):
+    codes = np.asarray(codes)
+    if column not in LABEL_LOOKUPS:
+        mapping = dico_mapping.get(column, {})
+        return np.array([mapping.get(code, str(code)) for code in codes.astype(object)], dtype=object)
+
+    lookup = LABEL_LOOKUPS[column]
+    labels = np.empty(len(codes), dtype=object)
+    known = (codes >= 0) & (codes < len(lookup))
+    labels[known] = lookup[codes[known].astype(np.intp)]
+    unknown = pd.isna(labels)
+    labels[unknown] = codes[unknown].astype(str)
+    labels[codes == OTHER_CODE] = OTHER_LABEL
+    return labels
+
+
+# Function returning the label of a single code (used by the select boxes)
+# It calls the untraced decode, so the options of a select box do not write one span each
+def label_of(code, column):
+    return decode.__wrapped__([code], column)[0]
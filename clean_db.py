@@ -1,179 +1,310 @@
 # Data Visualization Project - NADIRE Nada
 
+import os
 import streamlit as st
 import numpy as np
 import pandas as pd 
 import matplotlib.pyplot as plt
 from bokeh.plotting import figure
 import plotly.figure_factory as ff
+from streamlit import runtime
+from ingest import merge_tables, write_year, read_sources, is_up_to_date, source_hashes, source_path, TABLES
+from preview import preview_page, PAGE_SIZES
+from exports import build_export
+from validation import quarantine_path
+from store import dataset_key
+from ingest import main as ingest_main
 
 # Data source : data.gouv.fr
 # Data chosen : Bases de données annuelles des accidents corporels de la circulation routière en 2022
 
 #--------------------------------------------------------Step 1 : Explore & Clean Data----------------------------------------------------------
-# display title
-st.title ("Exploring and Cleaning Data")
+
+#------------------------------------------------------------------Preview----------------------------------------------------------------------
+# Function to display one page of a dataframe : the rows are filtered and sorted on the server (preview.py)
+# and only the rows of the page are sent to the browser, instead of the whole dataframe
+def preview_table(df, name):
+    columns = list(df.columns)
+    sort_column, order_column, filter_column, value_column = st.columns(4)
+    sort_by = sort_column.selectbox("Sort by", [None] + columns, format_func=lambda column: column or "File order",
+                                    key=f"{name}_sort_by")
+    ascending = order_column.radio("Order", ["Ascending", "Descending"], horizontal=True, key=f"{name}_order") == "Ascending"
+    filter_by = filter_column.selectbox("Filter on", [None] + columns, format_func=lambda column: column or "No filter",
+                                        key=f"{name}_filter_by")
+    filter_value = value_column.text_input("Value", key=f"{name}_filter_value", disabled=filter_by is None)
+
+    size_column, page_column = st.columns(2)
+    page_size = size_column.selectbox("Rows per page", PAGE_SIZES, key=f"{name}_page_size")
+    page = page_column.number_input("Page", min_value=1, value=1, step=1, key=f"{name}_page")
+
+    result = preview_page(df, page, page_size, sort_by, ascending, filter_by, filter_value)
+    st.dataframe(result.rows)
+    st.caption(f"{result.n_rows} rows, page {min(page, result.n_pages)} of {result.n_pages}")
+
+
+# Function returning the size and modification time of the four source files of a year (key of the cache of load_sources)
+def source_signature(year):
+    paths = [source_path(".", table, year) for table in TABLES]
+    return tuple((path, os.stat(path).st_size, os.stat(path).st_mtime_ns) for path in paths)
+
+
+# Function to read, clean and profile the four source files once (kept while the files do not change)
+# The profiles are also stored per content hash of the files (ingest.py), so a new server does not compute them again
+@st.cache_resource
+def load_sources(year, signature):
+    return read_sources(".", year)
+
+
+# Function to merge the four tables of a year once (kept while the source files do not change)
+# The paging, sorting and filtering of the previews rerun the page without merging and validating the tables again
+@st.cache_resource
+def load_merged(year, signature):
+    tables, _ = load_sources(year, signature)
+    return merge_tables(*(tables[table][0] for table in ("usagers", "lieux", "caracteristiques", "vehicules")))
+
+
+# Function to write the partition of a year if it was not built from the current source files, once per version of
+# the files : the content hashes of the files are not computed again at each rerun (main_df is not part of the key)
+@st.cache_resource
+def save_partition(year, signature, _main_df):
+    if not is_up_to_date(year, source_hashes(".", year)):
+        write_year(_main_df, year)
+
+
 #--------------------------------------------------------usagers dataframe----------------------------------------------------------------------
-# display subtitle
-st.markdown("## Usagers Dataframe")
-usagers = pd.read_csv("usagers-2022.csv", delimiter=';', low_memory=False)
+# Function to explore and clean the usagers dataframe
+# usagers is the cleaned dataframe and profile its column profile, both computed by read_sources in ingest.py
+def explore_usagers(usagers, profile):
+    # display subtitle
+    st.markdown("## Usagers Dataframe")
 
-# Check the dimensions of the DataFrame
-st.write("Shape of 'usagers' DataFrame:", usagers.shape)
+    # Check the dimensions of the DataFrame
+    st.write("Shape of 'usagers' DataFrame:", profile["shape"])
 
-# Explore the data using head()
-st.write("First 10 rows of 'usagers' DataFrame:")
-st.write(usagers.head(10))
+    # Explore the data using head()
+    st.write("First 10 rows of 'usagers' DataFrame:")
+    st.write(profile["head"])
 
-# Check data types of columns
-st.write("Data types of 'usagers' DataFrame:", usagers.dtypes)
+    # Check data types of columns
+    st.write("Data types of 'usagers' DataFrame:", profile["dtypes"])
 
-# Check for missing values
-st.write("Missing values in 'usagers' DataFrame:", usagers.isnull().sum())
+    # Check for missing values
+    st.write("Missing values in 'usagers' DataFrame:", profile["missing"])
 
-# Drop the unnecessary columns 
-usagers = usagers.dropna(subset=["an_nais"])
-st.write("Drop the missing values in column 'an_nais' :", usagers)
+    # Drop the unnecessary columns (already done by the worker that read the file)
+    st.write("Drop the missing values in column 'an_nais' :")
+    preview_table(usagers, "usagers")
 
-# Check summary statistics of numerical columns
-st.write("Summary statistics of numerical columns in 'usagers' DataFrame:")
-st.write(usagers.describe())
+    # Check summary statistics of numerical columns
+    st.write("Summary statistics of numerical columns in 'usagers' DataFrame:")
+    st.write(profile["describe"])
+
+    return usagers
 
 
 #-----------------------------------------------------------lieux dataframe---------------------------------------------------------------------
-# display subtitle
-st.markdown("## Lieux Dataframe")
+# Function to explore and clean the lieux dataframe
+# lieux is the cleaned dataframe and profile its column profile, both computed by read_sources in ingest.py
+def explore_lieux(lieux, profile):
+    # display subtitle
+    st.markdown("## Lieux Dataframe")
 
-lieux = pd.read_csv("lieux-2022.csv", delimiter=';', low_memory=False)
+    # Check the dimensions of the DataFrame
+    st.write("Shape of 'lieux' DataFrame:", profile["shape"])
 
-# Check the dimensions of the DataFrame
-st.write("Shape of 'lieux' DataFrame:", lieux.shape)
+    # Explore the data using head()
+    st.write("First 10 rows of 'lieux' DataFrame:")
+    st.write(profile["head"])
 
-# Explore the data using head()
-st.write("First 10 rows of 'lieux' DataFrame:")
-st.write(lieux.head(10))
+    # Check data types of columns
+    st.write("Data types of 'lieux' DataFrame:", profile["dtypes"])
 
-# Check data types of columns
-st.write("Data types of 'lieux' DataFrame:", lieux.dtypes)
+    # Check for missing values
+    st.write("Missing values in 'lieux' DataFrame:", profile["missing"])
 
-# Check for missing values
-st.write("Missing values in 'lieux' DataFrame:", lieux.isnull().sum())
+    # Drop the unnecessary columns (already done by the worker that read the file)
+    st.write("Drop the columns 'voie', 'v2' and 'lartpc' :")
+    preview_table(lieux, "lieux")
 
-# Drop the unnecessary columns 
-lieux = lieux.drop(["voie", "v2", "lartpc"], axis=1)
-st.write("Drop the columns 'voie', 'v2' and 'lartpc' :", lieux)
+    # Check summary statistics of numerical columns
+    st.write("Summary statistics of numerical columns in 'lieux' DataFrame:")
+    st.write(profile["describe"])
 
-# Check summary statistics of numerical columns
-st.write("Summary statistics of numerical columns in 'lieux' DataFrame:")
-st.write(lieux.describe())
+    return lieux
 
 
 #---------------------------------------------------------caractéristiques dataframe------------------------------------------------------------
-# display subtitle
-st.markdown("## Caractéristiques Dataframe")
+# Function to explore and clean the caractéristiques dataframe
+# caracteristiques is the cleaned dataframe and profile its column profile, both computed by read_sources in ingest.py
+def explore_caracteristiques(caracteristiques, profile):
+    # display subtitle
+    st.markdown("## Caractéristiques Dataframe")
 
-caracteristiques = pd.read_csv("caracteristiques-2022.csv", delimiter=';', low_memory=False)
+    # Check the dimensions of the DataFrame
+    st.write("Shape of 'caractéristiques' DataFrame:", profile["shape"])
 
-# Check the dimensions of the DataFrame
-st.write("Shape of 'caractéristiques' DataFrame:", caracteristiques.shape)
+    # Explore the data using head()
+    st.write("First 10 rows of 'caractéristiques' DataFrame:")
+    st.write(profile["head"])
 
-# Explore the data using head()
-st.write("First 10 rows of 'caractéristiques' DataFrame:")
-st.write(caracteristiques.head(10))
+    # Check data types of columns
+    st.write("Data types of 'caractéristiques' DataFrame:", profile["dtypes"])
 
-# Check data types of columns
-st.write("Data types of 'caractéristiques' DataFrame:", caracteristiques.dtypes)
+    # Check for missing values
+    st.write("Missing values in 'caractéristiques' DataFrame:", profile["missing"])
 
-# Check for missing values
-st.write("Missing values in 'caractéristiques' DataFrame:", caracteristiques.isnull().sum())
+    # Drop the unnecessary columns (already done by the worker that read the file)
+    st.write("Drop the missing values in column 'adr' :")
+    preview_table(caracteristiques, "caracteristiques")
 
-# Drop the unnecessary columns 
-caracteristiques = caracteristiques.dropna(subset=["adr"])
-st.write("Drop the missing values in column 'adr' :", caracteristiques)
+    # Check summary statistics of numerical columns
+    st.write("Summary statistics of numerical columns in 'caractéristiques' DataFrame:")
+    st.write(profile["describe"])
 
-# Check summary statistics of numerical columns
-st.write("Summary statistics of numerical columns in 'caractéristiques' DataFrame:")
-st.write(caracteristiques.describe())
+    return caracteristiques
 
 
 #------------------------------------------------------------véhicules dataframe---------------------------------------------------------------
-# display subtitle
-st.markdown("## Véhicules Dataframe")
+# Function to explore and clean the véhicules dataframe
+# vehicules is the cleaned dataframe and profile its column profile, both computed by read_sources in ingest.py
+def explore_vehicules(vehicules, profile):
+    # display subtitle
+    st.markdown("## Véhicules Dataframe")
 
-vehicules = pd.read_csv("vehicules-2022.csv", delimiter=';', low_memory=False)
+    # Check the dimensions of the DataFrame
+    st.write("Shape of 'véhicules' DataFrame:", profile["shape"])
 
-# Check the dimensions of the DataFrame
-st.write("Shape of 'véhicules' DataFrame:", vehicules.shape)
+    # Explore the data using head()
+    st.write("First 10 rows of 'véhicules' DataFrame:")
+    st.write(profile["head"])
 
-# Explore the data using head()
-st.write("First 10 rows of 'véhicules' DataFrame:")
-st.write(vehicules.head(10))
+    # Check data types of columns
+    st.write("Data types of 'véhicules' DataFrame:", profile["dtypes"])
 
-# Check data types of columns
-st.write("Data types of 'véhicules' DataFrame:", vehicules.dtypes)
+    # Check for missing values
+    st.write("Missing values in 'véhicules' DataFrame:", profile["missing"])
 
-# Check for missing values
-st.write("Missing values in 'véhicules' DataFrame:", vehicules.isnull().sum())
+    # Drop the unnecessary columns (already done by the worker that read the file)
+    st.write("Drop the column 'occutc' :")
+    preview_table(vehicules, "vehicules")
 
-# Drop the unnecessary columns 
-vehicules = vehicules.drop(["occutc"], axis=1)
-st.write("Drop the column 'occutc' :", vehicules)
+    # Check summary statistics of numerical columns
+    st.write("Summary statistics of numerical columns in 'véhicules' DataFrame:")
+    st.write(profile["describe"])
 
-# Check summary statistics of numerical columns
-st.write("Summary statistics of numerical columns in 'véhicules' DataFrame:")
-st.write(vehicules.describe())
+    return vehicules
 
 
 #------------------------------------------------------------------Merge Dataframes------------------------------------------------------------
-# Merge the dataframes based on 'Num_Acc'
-main_df = usagers.merge(lieux, on='Num_Acc', how='inner')
-main_df = main_df.merge(caracteristiques, left_on='Num_Acc', right_on='Accident_Id', how='inner')
-main_df = main_df.merge(vehicules, on='Num_Acc', how='inner')
+# Function to merge the four dataframes into the people-level dataframe main_df (merged once per version of the files)
+def merge_dataframes(signature):
+    # Merge the dataframes : each usager is joined to its own vehicle on 'Num_Acc' + 'id_vehicule',
+    # then to the place and the characteristics of its accident on 'Num_Acc'
+    # Each join is checked to be many-to-one, so main_df keeps one row per usager (no cross product)
+    # Only the necessary columns (COLUMNS_TO_KEEP in ingest.py) are selected from the merged dataframe
+    # For inputs that do not fit in memory, the same merge runs partition by partition with a memory budget :
+    # python clean_db.py --source-dir . --years 2022 --memory-budget 512
+    main_df, merge_report = load_merged(2022, signature)
 
-# Select only the necessary columns from the merged dataframe
-columns_to_keep = ['Num_Acc', 'mois', 'lum', 'dep', 'agg', 'int', 'atm', 'catr', 'surf', 'catv', 'id_usager', 'catu', 'grav', 'sexe', 'an_nais', 'trajet']
-main_df = main_df[columns_to_keep]
+    st.write("Rows added or removed by each merge stage :", merge_report)
+    st.write("Shape of the merged 'main_df' DataFrame (one row per usager):", main_df.shape)
 
+    return main_df
 
-#------------------------------------------------------------------Download Df------------------------------------------------------------------
-# Save the main_df as a CSV file
-main_df.to_csv(r'C:\Users\HP\Downloads\DataViz_Project_NADIRE_Nada\DataViz-Project-master\accidents.csv', index=False)
 
-st.write("The merged dataframe main_df is saved as a CSV file named accidents.csv")
-# Create a download button
-st.download_button(
-    label="Download main_df as CSV",
-    key="download_main_df",
-    data=main_df.to_csv().encode('utf-8'),
-    file_name='accidents.csv',
-    mime='text/csv',
-)
+#------------------------------------------------------------------Download Df------------------------------------------------------------------
+# Function to save main_df and propose it for download
+def save_dataframe(main_df, signature):
+    # Save the main_df as a typed and compressed columnar file (Parquet) in the 2022 partition of the dataset read by viz_project.py
+    # The partition is only written again when the source files changed (manifest of ingest.py)
+    save_partition(2022, signature, main_df)
+    st.write("The merged dataframe main_df is saved in the 2022 partition of the dataset (accidents/year=2022)")
+
+    # The codes are validated against dico.py when the partition is written : the invalid codes of each row are kept
+    # as a bitmask column and listed in the quarantine report of the year (validation.py)
+    if os.path.exists(quarantine_path(2022)):
+        st.write("Codes missing or unknown to dico.py (quarantine report) :", pd.read_csv(quarantine_path(2022)))
+
+    # Export of the 2022 dataset as a gzip-compressed CSV file (exports.py) : built once per dataset version
+    # in the exports directory, then the download is served from this file
+    # The download button reads the whole file, so it is only created after the "Prepare the download" action
+    # (kept in session_state until the file is downloaded), not on every rerun of the page
+    if st.button("Prepare the download of main_df"):
+        st.session_state["prepared_main_df"] = True
+    if st.session_state.get("prepared_main_df"):
+        path = build_export(dataset_key([2022]), "csv.gz")
+
+        # Create a download button
+        with open(path, "rb") as export_file:
+            st.download_button(
+                label="Download main_df as CSV (gzip)",
+                key="download_main_df",
+                data=export_file,
+                file_name='accidents.csv.gz',
+                mime='application/gzip',
+                on_click=st.session_state.pop,
+                args=("prepared_main_df", None),
+            )
 
 
 #-----------------------------------------------------------------------------------------------------------------------------------------------
 #--------------------------------------------------------------Step 2 : Data Visualization------------------------------------------------------
-st.markdown("## Identifying the questions to be answered")
+# Function to display the questions answered by the visualizations
+def display_questions():
+    st.markdown("## Identifying the questions to be answered")
+
+    st.markdown("#### A/ Determine the most accident-prone types of roads :")
+    st.write("1. Which types of roads have the highest accident rate ?")
+    st.write("2. Are there specific road charcteristics associated with a higher likelihood of accidents ?")
 
-st.markdown("#### A/ Determine the most accident-prone types of roads :")
-st.write("1. Which types of roads have the highest accident rate ?")
-st.write("2. Are there specific road charcteristics associated with a higher likelihood of accidents ?")
 
+    st.markdown("#### B/ Analyze road conditions and environmental factors :")
+    st.write("1. How do road conditions (e.g., wet, icy, dry) correlate with accident occurrence and severity? ")
+    st.write("2. Are certain weather conditions linked to an increased number of accidents ?")
 
-st.markdown("#### B/ Analyze road conditions and environmental factors :")
-st.write("1. How do road conditions (e.g., wet, icy, dry) correlate with accident occurrence and severity? ")
-st.write("2. Are certain weather conditions linked to an increased number of accidents ?")
 
+    st.markdown("#### C/ Explore vehicle types and their impact on mortality :")
+    st.write("Is there a correlation between the type of vehicle and the severity of accidents in terms of mortality? ")
 
-st.markdown("#### C/ Explore vehicle types and their impact on mortality :")
-st.write("Is there a correlation between the type of vehicle and the severity of accidents in terms of mortality? ")
 
+    st.markdown("#### D/ Investigate age and gender of accident victims :")
+    st.write("How does the age distribution of accident victims vary by gender? ")
 
-st.markdown("#### D/ Investigate age and gender of accident victims :")
-st.write("How does the age distribution of accident victims vary by gender? ")
+    st.markdown("#### E/ Geographic analysis :")
+    st.write("Are there regions or areas that consistently experience higher accident rates? ")
 
-st.markdown("#### E/ Geographic analysis :")
-st.write("Are there regions or areas that consistently experience higher accident rates? ")
 
+    st.markdown("#### F/ Investigate Usages and trajectories :")
+    st.write("Do certain types of trips or trajectories have a higher likelihood of accidents? ")
 
-st.markdown("#### F/ Investigate Usages and trajectories :")
-st.write("Do certain types of trips or trajectories have a higher likelihood of accidents? ")
+
+#-----------------------------------------------------------------------------------------------------------------------------------------------
+# Function to display the exploration and cleaning page
+def exploration_page():
+    # display title
+    st.title ("Exploring and Cleaning Data")
+
+    # The four files are read, cleaned and profiled at the same time by a pool of workers, once per version of the files
+    signature = source_signature(2022)
+    tables, read_time = load_sources(2022, signature)
+    st.write(f"The four files were read and profiled in {read_time:.2f} s")
+
+    explore_usagers(*tables["usagers"])
+    explore_lieux(*tables["lieux"])
+    explore_caracteristiques(*tables["caracteristiques"])
+    explore_vehicules(*tables["vehicules"])
+
+    main_df = merge_dataframes(signature)
+    save_dataframe(main_df, signature)
+
+    display_questions()
+
+
+# "streamlit run clean_db.py" displays the exploration page
+# "python clean_db.py --source-dir data --years 2021 2022" ingests the annual files into the year-partitioned dataset :
+# the schema differences between the releases are handled and only the years whose files changed are rebuilt
+if __name__ == '__main__':
+    if runtime.exists():
+        exploration_page()
+    else:
+        ingest_main()
@@ -0,0 +1,84 @@
+# Data Visualization Project - NADIRE Nada
+
+import datetime
+import numpy as np
+import pandas as pd
+from schema import MISSING_CODE, OTHER_CODE, MISSING_DEPARTMENT
+from validation import fold_invalid, VALIDITY_BITS, INVALID_CODES
+
+
+# Cuboids of the accidents dataset : the count of people for every combination of a few of the dimensions below
+# (those of a panel or of a query of api.py) is computed from the row-level frame once per dataset version, then
+# the panel slices its cuboid (one row per combination of the codes of its dimensions, a few thousand at most)
+# instead of scanning the rows. No base cube over all the dimensions is built : with the departments, the
+# categories of vehicle and the age buckets, it would have about as many rows as the dataset.
+
+CUBE_DIMENSIONS = ("mois", "agg", "catv", "atm", "trajet", "grav", "catu", "lum", "catr", "dep", "sexe", "age_bucket")
+
+# Columns of the row-level frame needed to build the cuboids (with the bitmask of the invalid codes of validation.py)
+CUBE_COLUMNS = tuple(dim for dim in CUBE_DIMENSIONS if dim != "age_bucket") + ("an_nais", INVALID_CODES)
+
+AGE_BUCKET_WIDTH = 5
+AGE_BUCKET_MAX = 100
+
+
+# Function to compute the age bucket (lower bound of a 5 years interval) from the year of birth
+# year is the year of each accident (the current year if the dataset has no 'year' column)
+# The missing years of birth are stored in the bucket -1
+def age_buckets(an_nais, year=None):
+    year = np.asarray(year, dtype=float) if year is not None else datetime.datetime.now().year
+    age = year - an_nais.to_numpy(dtype=float)
+    buckets = np.clip(age // AGE_BUCKET_WIDTH * AGE_BUCKET_WIDTH, 0, AGE_BUCKET_MAX)
+    buckets[np.isnan(age)] = -1
+    return buckets.astype(np.int8)
+
+
+# Function returning the label of an age bucket ("20-24", "100+")
+def age_bucket_label(bucket):
+    if bucket < 0:
+        return "Inconnu"
+    if bucket >= AGE_BUCKET_MAX:
+        return f"{AGE_BUCKET_MAX}+"
+    return f"{bucket}-{bucket + AGE_BUCKET_WIDTH - 1}"
+
+
+# Function to build a cuboid : one row per combination of some dimensions of CUBE_DIMENSIONS with its count
+# The missing codes (bitmask of validation.py) are grouped under MISSING_CODE and the codes without a label in dico.py
+# under OTHER_CODE, except the departments (text codes : each department keeps its own code, the missing ones
+# are grouped under MISSING_DEPARTMENT)
+def build_cuboid(df, dimensions):
+    keys = {dim: df[dim] for dim in dimensions if dim != "age_bucket"}
+    if "dep" in keys and keys["dep"].isna().any():
+        dep = keys["dep"]
+        if isinstance(dep.dtype, pd.CategoricalDtype) and MISSING_DEPARTMENT not in dep.cat.categories:
+            dep = dep.cat.add_categories([MISSING_DEPARTMENT])
+        keys["dep"] = dep.fillna(MISSING_DEPARTMENT)
+    if INVALID_CODES in df.columns:
+        flags = df[INVALID_CODES].to_numpy()
+        for dim in keys:
+            if dim in VALIDITY_BITS and dim != "dep":
+                keys[dim] = fold_invalid(keys[dim], flags, dim)
+    if "age_bucket" in dimensions:
+        year = df["year"] if "year" in df.columns else None
+        keys["age_bucket"] = pd.Series(age_buckets(df["an_nais"], year), index=df.index)
+    frame = pd.DataFrame(keys)[list(dimensions)]
+    cuboid = frame.groupby(list(dimensions), observed=True, dropna=False).size().reset_index(name="count")
+    cuboid["count"] = cuboid["count"].astype(np.int64)
+    return cuboid
+
+
+# Function to answer a filter + group query on a cuboid
+# filters is a dict {dimension: code or list of codes}, the result is a Series of counts
+# valid lists the dimensions whose missing or unknown codes (MISSING_CODE and OTHER_CODE in the cuboid) are left out
+def slice_cube(cube, group_by, filters=None, valid=()):
+    mask = np.ones(len(cube), dtype=bool)
+    for dim, value in (filters or {}).items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        mask &= cube[dim].isin(values).to_numpy()
+    for dim in valid:
+        mask &= ~np.isin(cube[dim].to_numpy(), (MISSING_CODE, OTHER_CODE))
+    selected = cube[mask]
+    group_by = list(group_by)
+    if not group_by:
+        return pd.Series([selected["count"].sum()], name="count")
+    return selected.groupby(group_by, observed=True)["count"].sum()
@@ -47,6 +47,15 @@ dico_mapping = \
 	11 : "Novembre",
 	12 : "Décembre",
 	},
+	'weekday':{
+	0 : "Lundi",
+	1 : "Mardi",
+	2 : "Mercredi",
+	3 : "Jeudi",
+	4 : "Vendredi",
+	5 : "Samedi",
+	6 : "Dimanche",
+	},
 	'surf':{
 	1 : "normale",
 	2 : "mouillée",
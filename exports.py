@@ -0,0 +1,106 @@
+# Data Visualization Project - NADIRE Nada
+
+import glob
+import os
+import shutil
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from store import read_year_table, dataset_versions, temporary_path, ACCIDENTS_SCHEMA, DATASET_DIR
+from tracing import span
+
+
+# Exports of the dataset : each export (format + years + filters) is built once per dataset version into the
+# cache directory, record batch by record batch from the shared copy of the dataset (no full frame in memory),
+# and served from disk : exports/2022/<version>/accidents-catr=3.csv.gz
+
+EXPORT_DIR = "exports"
+EXPORT_CHUNK_ROWS = 100_000
+
+# Formats of the exports : name -> (file extension, mime type)
+EXPORT_FORMATS = {
+    "CSV (gzip)": ("csv.gz", "application/gzip"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+# Columns of the exports : the merged dataset and the year of each row
+EXPORT_SCHEMA = ACCIDENTS_SCHEMA.append(pa.field("year", pa.int16()))
+
+
+# Function returning the directory of the exports of a dataset version
+def export_dir(dataset, export_root=EXPORT_DIR):
+    years = "-".join(str(year) for year in dataset.years)
+    return os.path.join(export_root, years, dataset.version)
+
+
+# Function returning the file name of an export : the applied filters are part of the name ("accidents-catr=3.csv.gz")
+def export_name(extension, filters=None):
+    applied = [f"{dim}={','.join(map(str, value)) if isinstance(value, (list, tuple)) else value}"
+               for dim, value in sorted((filters or {}).items()) if value is not None]
+    return "-".join(["accidents"] + applied) + "." + extension
+
+
+# Function returning the path of an export in the cache directory
+def export_path(dataset, extension, filters=None, export_root=EXPORT_DIR):
+    return os.path.join(export_dir(dataset, export_root), export_name(extension, filters))
+
+
+# Function returning the record batches of one year, with the export columns and only the rows of the filters
+def export_batches(year, version, filters, chunk_rows=EXPORT_CHUNK_ROWS, dataset_dir=DATASET_DIR):
+    table = read_year_table(year, None, dataset_dir, version)
+    for batch in table.to_batches(max_chunksize=chunk_rows):
+        columns = [batch.column(name).cast(field.type) for name, field in zip(ACCIDENTS_SCHEMA.names, ACCIDENTS_SCHEMA)]
+        columns.append(pa.array(np.full(batch.num_rows, year, dtype=np.int16)))
+        batch = pa.RecordBatch.from_arrays(columns, schema=EXPORT_SCHEMA)
+        for dim, value in (filters or {}).items():
+            if value is not None:
+                values = value if isinstance(value, (list, tuple, set)) else [value]
+                batch = batch.filter(pc.is_in(batch.column(dim), value_set=pa.array(values, EXPORT_SCHEMA.field(dim).type)))
+        yield batch
+
+
+# Function opening the writer of an export format on a file
+# Returns the writer and the list of what must be closed at the end, in order
+def open_export_writer(path, extension):
+    if extension == "parquet":
+        writer = pq.ParquetWriter(path, EXPORT_SCHEMA, compression="zstd")
+        return writer, [writer]
+    sink = pa.CompressedOutputStream(path, "gzip")
+    writer = pa_csv.CSVWriter(sink, EXPORT_SCHEMA)
+    return writer, [writer, sink]
+
+
+# Function returning the path of an export, built (once per dataset version) if it is not in the cache directory
+# filters is {dimension: code, list of codes or None} (the active filters of the dashboard)
+def build_export(dataset, extension, filters=None, export_root=EXPORT_DIR, dataset_dir=DATASET_DIR):
+    path = export_path(dataset, extension, filters, export_root)
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    prune_exports(dataset, export_root)
+    with span("export", format=extension) as record:
+        record["rows"] = 0
+        # Written to a temporary file, then renamed : a reader never sees a partial export
+        tmp_path = temporary_path(path)
+        writer, closables = open_export_writer(tmp_path, extension)
+        try:
+            for year, version in zip(dataset.years, dataset_versions(dataset)):
+                for batch in export_batches(year, version, filters, dataset_dir=dataset_dir):
+                    writer.write_batch(batch)
+                    record["rows"] += batch.num_rows
+        finally:
+            for closable in closables:
+                closable.close()
+        os.replace(tmp_path, path)
+    return path
+
+
+# Function to remove the exports of the previous versions of the same years
+def prune_exports(dataset, export_root=EXPORT_DIR):
+    current = export_dir(dataset, export_root)
+    for directory in glob.glob(os.path.join(os.path.dirname(current), "*")):
+        if directory != current:
+            shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,59 @@
+# Data Visualization Project - NADIRE Nada
+
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+
+# Filter index of the row-level dataset : for each code of the filter dimensions, the sorted positions
+# of its rows. It is built once per dataset version; a filter is then a lookup, a compound filter an
+# intersection of position arrays, and the panels aggregate over the selected positions of their columns
+# instead of a filtered copy of the frame (data[data['catr'] == code]).
+
+# Filters of the sidebar applied to the row-level Key numbers and map (the only dimensions that are queried)
+FILTER_DIMENSIONS = ("catr", "lum")
+
+# n_rows : number of rows of the indexed frame, positions : {dimension: {code: sorted positions}}
+FilterIndex = namedtuple("FilterIndex", ["n_rows", "positions"])
+
+NO_ROWS = np.empty(0, dtype=np.int32)
+
+
+# Function to build the filter index of a frame (one stable sort per dimension)
+def build_filter_index(df, dimensions=FILTER_DIMENSIONS):
+    positions = {}
+    for dim in dimensions:
+        codes, values = pd.factorize(df[dim], sort=True)
+        order = np.argsort(codes, kind="stable").astype(np.int32)
+        bounds = np.searchsorted(codes[order], np.arange(len(values) + 1))
+        positions[dim] = {value: order[bounds[i]:bounds[i + 1]] for i, value in enumerate(values)}
+    return FilterIndex(len(df), positions)
+
+
+# Function returning the positions of the rows of one filter (a code or a list of codes)
+def filter_positions(index, dim, value):
+    values = value if isinstance(value, (list, tuple, set)) else [value]
+    parts = [index.positions[dim].get(code, NO_ROWS) for code in values]
+    return parts[0] if len(parts) == 1 else np.sort(np.concatenate(parts))
+
+
+# Function returning the sorted positions of the rows selected by a filter spec {dimension: code, list or None}
+# Returns None when no filter is applied (all the rows)
+def select_positions(index, filters):
+    selections = [filter_positions(index, dim, value) for dim, value in filters.items()
+                  if value is not None and dim in index.positions]
+    if not selections:
+        return None
+    # Intersect from the most selective filter, with a bitmap of the rows of each other filter
+    selections.sort(key=len)
+    positions = selections[0]
+    for other in selections[1:]:
+        bitmap = np.zeros(index.n_rows, dtype=bool)
+        bitmap[other] = True
+        positions = positions[bitmap[positions]]
+    return positions
+
+
+# Function returning the values of a column at the selected positions (all of them if positions is None)
+def take(values, positions):
+    return values if positions is None else values[positions]
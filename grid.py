@@ -0,0 +1,113 @@
+# Data Visualization Project - NADIRE Nada
+
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from filter_index import take
+
+
+# Grid of the accident map : the coordinates of the rows are binned once per dataset version into square cells
+# of several sizes (one per resolution of the map) and each row keeps the number of its cell at each resolution.
+# The map of a filter set is then a bincount of the cells of the selected rows : one point per non-empty cell,
+# so the points sent to the browser depend on the area covered by the accidents, not on their number.
+
+# Size of the cells of each resolution of the map, in degrees of latitude and longitude
+GRID_RESOLUTIONS = {
+    "Country": 1.0,
+    "Region": 0.5,
+    "Department": 0.25,
+    "Local": 0.1,
+}
+DEFAULT_RESOLUTION = "Department"
+
+# Length of one degree of latitude in meters (radius of the points of the map)
+METERS_PER_DEGREE = 111_000
+
+# Gravité 2 corresponds to 'Tué', 3 to 'Blessé hospitalisé'
+KILLED = 2
+HOSPITALIZED = 3
+
+# Colors of the points, from the least to the most severe cells (share of people killed or hospitalized)
+LOW_SEVERITY_COLOR = np.array([255, 200, 0])
+HIGH_SEVERITY_COLOR = np.array([200, 0, 0])
+
+# cells : {resolution: cell number of each row (-1 without coordinates)}, centers : {resolution: (lat, long) of each cell},
+# first : 1 on the first row of each accident (accidents per cell), severe / killed : 1 if the person was killed or hospitalized / killed
+MapGrid = namedtuple("MapGrid", ["cells", "centers", "first", "severe", "killed"])
+
+
+# Function binning coordinates into square cells of a given size
+# Returns the cell number of each row (-1 without coordinates) and the center of each cell
+def bin_coordinates(lat, long, size):
+    valid = np.isfinite(lat) & np.isfinite(long) & (np.abs(lat) <= 90) & (np.abs(long) <= 180)
+    columns = int(np.ceil(360 / size))
+    row = np.floor((lat[valid] + 90) / size).astype(np.int64)
+    column = np.floor((long[valid] + 180) / size).astype(np.int64)
+    keys, numbers = np.unique(row * columns + column, return_inverse=True)
+
+    cells = np.full(len(lat), -1, dtype=np.int32)
+    cells[valid] = numbers
+    centers = ((keys // columns + 0.5) * size - 90, (keys % columns + 0.5) * size - 180)
+    return cells, centers
+
+
+# Function to build the grid of the map from the row-level frame (Num_Acc, grav, lat, long)
+def build_grid(df):
+    lat = df['lat'].to_numpy(dtype=np.float64, na_value=np.nan)
+    long = df['long'].to_numpy(dtype=np.float64, na_value=np.nan)
+    cells, centers = {}, {}
+    for resolution, size in GRID_RESOLUTIONS.items():
+        cells[resolution], centers[resolution] = bin_coordinates(lat, long, size)
+
+    grav = df['grav'].to_numpy()
+    return MapGrid(
+        cells=cells,
+        centers=centers,
+        first=(~df['Num_Acc'].duplicated()).to_numpy().astype(np.int8),
+        severe=np.isin(grav, (KILLED, HOSPITALIZED)).astype(np.int8),
+        killed=(grav == KILLED).astype(np.int8),
+    )
+
+
+# Function computing the cells of the map at one resolution for the selected rows (all the rows if positions is None)
+# Returns one row per non-empty cell : center, accidents, people, killed and severity (share of people killed or hospitalized)
+def grid_cells(grid, resolution, positions=None):
+    cells = take(grid.cells[resolution], positions)
+    located = cells >= 0
+    cells = cells[located]
+    n_cells = len(grid.centers[resolution][0])
+
+    counts = {
+        "accidents": np.bincount(cells, weights=take(grid.first, positions)[located], minlength=n_cells),
+        "people": np.bincount(cells, minlength=n_cells),
+        "killed": np.bincount(cells, weights=take(grid.killed, positions)[located], minlength=n_cells),
+        "severe": np.bincount(cells, weights=take(grid.severe, positions)[located], minlength=n_cells),
+    }
+    non_empty = counts["people"] > 0
+    lat, long = grid.centers[resolution]
+    people = counts["people"][non_empty]
+    return pd.DataFrame({
+        "lat": lat[non_empty].astype(np.float32),
+        "lon": long[non_empty].astype(np.float32),
+        "accidents": counts["accidents"][non_empty].astype(np.int32),
+        "people": people.astype(np.int32),
+        "killed": counts["killed"][non_empty].astype(np.int32),
+        "severity": (counts["severe"][non_empty] / people).astype(np.float32),
+    })
+
+
+# Function returning the points of the map : the center of each cell, its radius (number of accidents)
+# and its color (severity), rounded so that each point only takes a few bytes (st.map needs 64 bits coordinates)
+def map_points(cells, resolution):
+    if cells.empty:
+        return pd.DataFrame({"lat": [], "lon": [], "size": [], "color": []})
+    half_cell = GRID_RESOLUTIONS[resolution] * METERS_PER_DEGREE / 2
+    size = np.sqrt(cells["accidents"] / cells["accidents"].max()) * half_cell
+    share = cells["severity"].to_numpy()[:, None]
+    rgb = np.rint(LOW_SEVERITY_COLOR + (HIGH_SEVERITY_COLOR - LOW_SEVERITY_COLOR) * share).astype(int)
+    return pd.DataFrame({
+        "lat": cells["lat"].astype(np.float64).round(3),
+        "lon": cells["lon"].astype(np.float64).round(3),
+        "size": size.round().astype(np.int32),
+        "color": [f"#{r:02x}{g:02x}{b:02x}" for r, g, b in rgb],
+    })
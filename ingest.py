@@ -0,0 +1,523 @@
+# Data Visualization Project - NADIRE Nada
+
+import argparse
+import codecs
+import datetime
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from store import (open_parquet_writer, append_parquet, write_parquet, partition_path, publish_shared, has_current_schema,
+                   temporary_path, dataset_lock, DATASET_DIR)
+from schema import read_dtypes, apply_schema, parse_coordinates, parse_hours, parse_weekdays, COORDINATE_COLUMNS
+from tracing import peak_memory_mb
+from validation import code_flags, write_quarantine, INVALID_CODES
+
+
+# Merge pipeline of the four ONISR tables into the people-level dataset (one row per usager)
+# usagers -> vehicules on (Num_Acc, id_vehicule), then -> lieux and caracteristiques on Num_Acc
+
+# Columns of the merged dataset
+COLUMNS_TO_KEEP = ['Num_Acc', 'mois', 'weekday', 'hour', 'lum', 'dep', 'agg', 'int', 'atm', 'lat', 'long', 'catr', 'surf', 'catv', 'id_usager', 'catu', 'grav', 'sexe', 'an_nais', 'trajet']
+
+# Columns read from each table (join keys + columns of the merged dataset)
+TABLE_COLUMNS = {
+    "usagers": ['Num_Acc', 'id_vehicule', 'id_usager', 'catu', 'grav', 'sexe', 'an_nais', 'trajet'],
+    "vehicules": ['Num_Acc', 'id_vehicule', 'catv'],
+    "lieux": ['Num_Acc', 'catr', 'surf'],
+    "caracteristiques": ['Num_Acc', 'mois', 'weekday', 'hour', 'lum', 'dep', 'agg', 'int', 'atm', 'lat', 'long'],
+}
+
+# Date and time of the accidents in caracteristiques, read to derive the weekday and the hour (time buckets of timecube.py)
+TIME_SOURCE_COLUMNS = {"caracteristiques": ['jour', 'an', 'hrmn']}
+
+VEHICLE_KEYS = ['Num_Acc', 'id_vehicule']
+ACCIDENT_KEYS = ['Num_Acc']
+
+# Same cleaning as the exploration page of clean_db.py : rows with a missing value in these columns are dropped
+REQUIRED_COLUMNS = {
+    "usagers": ['an_nais'],
+    "caracteristiques": ['adr'],
+}
+
+TABLES = ("usagers", "lieux", "caracteristiques", "vehicules")
+
+# Estimates used to turn the memory budget into a number of partitions and a chunk size :
+# a partition of the four tables takes about MEMORY_FACTOR times its size on disk while it is merged,
+# and a row of a CSV chunk takes about BYTES_PER_ROW bytes once parsed
+MEMORY_FACTOR = 6
+BYTES_PER_ROW = 400
+DEFAULT_MEMORY_BUDGET_MB = 512
+
+# Cleaning steps of the exploration page of clean_db.py, applied to each table right after it is read
+EXPLORATION_CLEANING = {
+    "usagers": lambda df: df.dropna(subset=["an_nais"]),
+    "lieux": lambda df: df.drop(["voie", "v2", "lartpc"], axis=1),
+    "caracteristiques": lambda df: df.dropna(subset=["adr"]),
+    "vehicules": lambda df: df.drop(["occutc"], axis=1),
+}
+
+# Bytes of a source file read to detect its encoding (the header of the old releases is ASCII, their rows are latin-1)
+SNIFF_BYTES = 1024 * 1024
+
+# Number of workers used to read the four source tables at the same time
+DEFAULT_WORKERS = 4
+
+# Column profiles of the source tables, computed once per content hash of the source file :
+# accidents/profiles/usagers-<hash>.pkl
+PROFILE_DIR = os.path.join(DATASET_DIR, "profiles")
+
+# Manifest of the dataset : content hashes of the source files of each ingested year
+MANIFEST_NAME = "manifest.json"
+
+# Differences between the annual releases of the ONISR files :
+# - files named "usagers_2018.csv" before 2019, "usagers-2019.csv" since (and "carcteristiques-2022.csv" in 2022)
+# - latin-1 files separated by ',' (or tabs) before 2019, utf-8 files separated by ';' since
+# - 'Accident_Id' instead of 'Num_Acc' in caracteristiques in 2022
+# - no 'id_vehicule' before 2019 (the vehicle is 'num_veh' inside its accident), no 'id_usager' in some releases
+# - departments coded on 3 digits before 2019 ('590' for '59', '201' for '2A')
+# - coordinates in 1/100000 of degree in most releases before 2019 (5051500 for 50.515, 0 when unknown), in degrees since
+# - year on 2 digits ('18') and hour as an integer (1640, 5 for 00:05) in some releases before 2019, '16:40' since
+SOURCE_FILE_PATTERNS = ("{table}-{year}.csv", "{table}_{year}.csv")
+SOURCE_TABLE_NAMES = {"caracteristiques": ("caracteristiques", "carcteristiques")}
+COLUMN_ALIASES = {'Accident_Id': 'Num_Acc'}
+OLD_CORSICA = {'201': '2A', '202': '2B'}
+
+
+# Exception raised when a join would duplicate rows of the people-level table
+class JoinCardinalityError(ValueError):
+    pass
+
+
+# Function to add one line to the merge report
+def report_stage(report, stage, keys, rows_before, rows_after):
+    report.append({
+        "stage": stage,
+        "keys": " + ".join(keys),
+        "rows_before": rows_before,
+        "rows_after": rows_after,
+        "rows_added": max(rows_after - rows_before, 0),
+        "rows_removed": max(rows_before - rows_after, 0),
+    })
+
+
+# Function to keep one row per key on the right side of a join (the lieux table can repeat an accident)
+def deduplicate(df, keys, stage, report):
+    deduplicated = df.drop_duplicates(subset=keys, keep='first')
+    report_stage(report, stage, keys, len(df), len(deduplicated))
+    return deduplicated
+
+
+# Function to join the people-level table with a table that has at most one row per key
+# The join is checked to be many-to-one, so it can remove rows (no match) but never add any
+def keyed_merge(left, right, keys, stage, report):
+    try:
+        merged = left.merge(right, on=keys, how='inner', validate='many_to_one')
+    except pd.errors.MergeError as error:
+        raise JoinCardinalityError(f"{stage} : the keys {keys} are not unique on the right table") from error
+    if len(merged) > len(left):
+        raise JoinCardinalityError(f"{stage} : the join added {len(merged) - len(left)} rows")
+    report_stage(report, stage, keys, len(left), len(merged))
+    return merged
+
+
+# Function to add the time buckets of the accidents to caracteristiques : weekday and hour (int8 codes, -1 when missing)
+def add_time_buckets(caracteristiques):
+    return caracteristiques.assign(
+        weekday=parse_weekdays(caracteristiques['an'], caracteristiques['mois'], caracteristiques['jour']),
+        hour=parse_hours(caracteristiques['hrmn']),
+    )
+
+
+# Function to merge the four tables into the people-level dataset
+# The codes of each row are validated against dico.py (bitmask of the invalid codes, validation.py)
+# Returns the merged dataset and the report of the rows added / removed by each stage
+def merge_tables(usagers, lieux, caracteristiques, vehicules):
+    report = []
+    caracteristiques = caracteristiques.rename(columns={'Accident_Id': 'Num_Acc'})
+    if 'hour' not in caracteristiques.columns:
+        caracteristiques = add_time_buckets(caracteristiques)
+
+    usagers = usagers[TABLE_COLUMNS["usagers"]]
+    vehicules = vehicules[TABLE_COLUMNS["vehicules"]]
+    lieux = deduplicate(lieux[TABLE_COLUMNS["lieux"]], ACCIDENT_KEYS, "lieux : one row per accident", report)
+    caracteristiques = caracteristiques[TABLE_COLUMNS["caracteristiques"]]
+
+    main_df = keyed_merge(usagers, vehicules, VEHICLE_KEYS, "usagers x vehicules", report)
+    main_df = keyed_merge(main_df, lieux, ACCIDENT_KEYS, "x lieux", report)
+    main_df = keyed_merge(main_df, caracteristiques, ACCIDENT_KEYS, "x caracteristiques", report)
+
+    main_df = main_df[COLUMNS_TO_KEEP]
+    return main_df.assign(**{INVALID_CODES: code_flags(main_df)}), pd.DataFrame(report)
+
+
+#------------------------------------------------------------Source files----------------------------------------------------------------------
+# The source files of every annual release are read into the columns of the current release (see SOURCE_FILE_PATTERNS).
+
+
+# Function returning the path of a source table ("usagers-2022.csv", "usagers_2018.csv")
+def source_path(source_dir, table, year):
+    for name in SOURCE_TABLE_NAMES.get(table, (table,)):
+        for pattern in SOURCE_FILE_PATTERNS:
+            path = os.path.join(source_dir, pattern.format(table=name, year=year))
+            if os.path.exists(path):
+                return path
+    raise FileNotFoundError(f"No '{table}' file for {year} in {source_dir}")
+
+
+# Function returning the years that have their four source files in a directory
+def source_years(source_dir):
+    years = set()
+    for name in os.listdir(source_dir):
+        match = re.fullmatch(r"usagers[-_](\d{4})\.csv", name)
+        if match:
+            years.add(int(match.group(1)))
+    return sorted(year for year in years if all(has_source(source_dir, table, year) for table in TABLES))
+
+
+# Function checking that a source table exists
+def has_source(source_dir, table, year):
+    try:
+        source_path(source_dir, table, year)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+# Function to detect the encoding of a source file from its first SNIFF_BYTES bytes and its separator from its header line
+def sniff_format(path):
+    with open(path, "rb") as f:
+        sample = f.read(SNIFF_BYTES)
+    try:
+        # Incremental decoder : a character cut at the end of the sample is not an error
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        encoding = "utf-8"
+    except UnicodeDecodeError:
+        encoding = "latin-1"
+    line = sample.split(b"\n", 1)[0].decode(encoding)
+    delimiter = max((";", ",", "\t"), key=line.count)
+    return encoding, delimiter
+
+
+# Function returning the columns to read from a source table (the names differ between releases)
+def read_columns(path, table):
+    encoding, delimiter = sniff_format(path)
+    header = pd.read_csv(path, delimiter=delimiter, encoding=encoding, nrows=0).columns
+    wanted = set(TABLE_COLUMNS[table] + REQUIRED_COLUMNS.get(table, []) + TIME_SOURCE_COLUMNS.get(table, [])
+                 + ['num_veh'] + list(COLUMN_ALIASES))
+    return [column for column in header if column in wanted]
+
+
+# Function to convert the departments coded on 3 digits before 2019 ('590', '201') into the current codes
+def normalize_departments(dep):
+    codes = dep.astype(str).str.strip()
+    mapping = {}
+    for code in codes.unique():
+        if code in OLD_CORSICA:
+            mapping[code] = OLD_CORSICA[code]
+        elif len(code) == 3 and code.endswith("0"):
+            mapping[code] = code[:-1].zfill(2)
+        else:
+            mapping[code] = code
+    return codes.map(mapping)
+
+
+# Function returning the columns kept from a table : its columns in the merged dataset and the required ones
+# (an_nais is both, so it is listed once)
+def table_columns(table):
+    return list(dict.fromkeys(TABLE_COLUMNS[table] + REQUIRED_COLUMNS.get(table, [])))
+
+
+# Function to bring a table of any release to the columns of the current release
+def normalize_table(df, table, year):
+    df = df.rename(columns=COLUMN_ALIASES)
+    if table in ("usagers", "vehicules") and 'id_vehicule' not in df.columns:
+        # Before 2019 the vehicle is identified by 'num_veh' inside its accident
+        df['id_vehicule'] = df['num_veh'].astype(str).str.strip()
+    if table == "usagers" and 'id_usager' not in df.columns:
+        df['id_usager'] = pd.Series(pd.NA, index=df.index, dtype=object)
+    if table == "caracteristiques" and year < 2019:
+        df['dep'] = normalize_departments(df['dep'])
+        for column in COORDINATE_COLUMNS:
+            # A value out of the range of the degrees is in 1/100000 of degree
+            values = parse_coordinates(df[column])
+            values = values.where(values.abs() <= 180, values / 100000)
+            df[column] = values.where(values != 0)
+    if table == "caracteristiques":
+        df = add_time_buckets(df)
+    return df[table_columns(table)]
+
+
+# Function to read a source table of any release chunk by chunk (only the columns of the merged dataset)
+def read_chunks(path, table, year, chunk_rows):
+    encoding, delimiter = sniff_format(path)
+    # The columns are parsed into the compact dtypes of schema.py, whatever the content of a chunk
+    chunks = pd.read_csv(path, delimiter=delimiter, encoding=encoding, usecols=read_columns(path, table),
+                         dtype=read_dtypes(), chunksize=chunk_rows)
+    for chunk in chunks:
+        yield apply_schema(normalize_table(chunk, table, year))
+
+
+#------------------------------------------------------------Parallel reading------------------------------------------------------------------
+# The four source tables are parsed at the same time by a pool of workers (threads : the CSV parser of pandas
+# releases the GIL while it tokenizes, or processes), and each worker also computes the column profile of its
+# table, so the exploration page does not run a second pass over the data.
+
+
+# Function returning the column profile of a table : shape, first rows, dtypes, missing values and summary statistics
+def profile_table(df, cleaned):
+    return {
+        "shape": df.shape,
+        "head": df.head(10),
+        "dtypes": df.dtypes,
+        "missing": df.isnull().sum(),
+        "describe": cleaned.describe(),
+    }
+
+
+# Function returning the path of the stored profile of a source file (one per content hash)
+def profile_path(path, table, profile_dir=PROFILE_DIR):
+    return os.path.join(profile_dir, f"{table}-{file_hash(path)[:16]}.pkl")
+
+
+# Function to read one source table of the exploration page, clean it and compute its column profile
+# The profile is stored in profile_dir and read back while the source file does not change (profile_dir=None : always computed)
+def read_and_profile(path, table, profile_dir=PROFILE_DIR):
+    encoding, delimiter = sniff_format(path)
+    df = apply_schema(pd.read_csv(path, delimiter=delimiter, encoding=encoding, low_memory=False, dtype=read_dtypes()))
+    cleaned = EXPLORATION_CLEANING[table](df)
+    if profile_dir is None:
+        return cleaned, profile_table(df, cleaned)
+
+    stored = profile_path(path, table, profile_dir)
+    if os.path.exists(stored):
+        return cleaned, pd.read_pickle(stored)
+    profile = profile_table(df, cleaned)
+    os.makedirs(profile_dir, exist_ok=True)
+    # Written to a temporary file, then renamed : a reader never sees a partial profile
+    tmp_path = temporary_path(stored)
+    pd.to_pickle(profile, tmp_path)
+    os.replace(tmp_path, stored)
+    return cleaned, profile
+
+
+# Function to read, clean and profile the four source tables of a year with a pool of workers
+# executor is "thread" or "process", workers=1 is the serial path (one table after the other)
+# Returns {table: (cleaned dataframe, profile)} and the time taken in seconds
+def read_sources(source_dir=".", year=2022, workers=DEFAULT_WORKERS, executor="thread", profile_dir=PROFILE_DIR):
+    paths = {table: source_path(source_dir, table, year) for table in TABLES}
+    start_time = time.perf_counter()
+    if workers == 1:
+        results = {table: read_and_profile(path, table, profile_dir) for table, path in paths.items()}
+    else:
+        pool_class = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+        with pool_class(max_workers=workers) as pool:
+            futures = {table: pool.submit(read_and_profile, path, table, profile_dir) for table, path in paths.items()}
+            results = {table: future.result() for table, future in futures.items()}
+    return results, time.perf_counter() - start_time
+
+
+#------------------------------------------------------------Streaming build-------------------------------------------------------------------
+# The tables are read in chunks and spilled to disk by Num_Acc range, then each range is merged on its own
+# and appended to the output store : the peak memory depends on the budget, not on the size of the input.
+
+
+# Function to plan the streaming build from the memory budget : number of partitions and rows per chunk
+def plan_partitions(paths, memory_budget_mb):
+    budget = memory_budget_mb * 1024 * 1024
+    input_size = sum(os.path.getsize(path) for path in paths)
+    n_partitions = max(1, math.ceil(input_size * MEMORY_FACTOR / budget))
+    chunk_rows = max(1000, budget // (4 * BYTES_PER_ROW))
+    return n_partitions, chunk_rows
+
+
+# Function to compute the Num_Acc boundaries of the partitions (same number of accidents in each range)
+def partition_boundaries(caracteristiques_path, year, n_partitions, chunk_rows):
+    chunks = read_chunks(caracteristiques_path, "caracteristiques", year, chunk_rows)
+    ids = [chunk['Num_Acc'].to_numpy() for chunk in chunks]
+    ids = np.unique(np.concatenate(ids))
+    positions = np.linspace(0, len(ids), n_partitions + 1)[1:-1].astype(int)
+    return ids[positions]
+
+
+# Function to spill the chunks of a table into one CSV file per Num_Acc range
+def spill_table(path, table, year, boundaries, chunk_rows, spill_dir):
+    spill_paths = [os.path.join(spill_dir, f"{table}-{partition}.csv") for partition in range(len(boundaries) + 1)]
+    for chunk in read_chunks(path, table, year, chunk_rows):
+        partitions = np.searchsorted(boundaries, chunk['Num_Acc'].to_numpy(), side='right')
+        for partition, piece in chunk.groupby(partitions):
+            spill_path = spill_paths[partition]
+            piece.to_csv(spill_path, mode='a', index=False, header=not os.path.exists(spill_path))
+    return spill_paths
+
+
+# Function to read the spilled rows of one table for one partition
+def read_spill(spill_path, table):
+    if not os.path.exists(spill_path):
+        return pd.DataFrame({column: pd.Series(dtype=object) for column in table_columns(table)})
+    return apply_schema(pd.read_csv(spill_path, dtype=read_dtypes()))
+
+
+# Function to build the merged dataset partition by partition with a bounded memory
+# Returns the merge report summed over the partitions
+def build_streaming(source_dir, year, output_path, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, workers=DEFAULT_WORKERS):
+    paths = {table: source_path(source_dir, table, year) for table in TABLES}
+    n_partitions, chunk_rows = plan_partitions(paths.values(), memory_budget_mb)
+    print(f"Streaming build of {year} : {n_partitions} partitions by Num_Acc range, chunks of {chunk_rows} rows")
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    spill_dir = tempfile.mkdtemp(prefix="accidents-spill-", dir=os.path.dirname(os.path.abspath(output_path)))
+    tmp_output = temporary_path(output_path)
+    reports = []
+    try:
+        boundaries = partition_boundaries(paths["caracteristiques"], year, n_partitions, chunk_rows)
+        # The four tables are spilled at the same time (the chunk size already accounts for four readers)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {table: pool.submit(spill_table, paths[table], table, year, boundaries, chunk_rows, spill_dir)
+                       for table in TABLES}
+            spills = {table: future.result() for table, future in futures.items()}
+
+        writer = open_parquet_writer(tmp_output)
+        try:
+            for partition in range(len(boundaries) + 1):
+                tables = {table: read_spill(spills[table][partition], table) for table in TABLES}
+                for table, columns in REQUIRED_COLUMNS.items():
+                    tables[table] = tables[table].dropna(subset=columns)
+                main_df, report = merge_tables(**tables)
+                append_parquet(writer, main_df)
+                reports.append(report)
+                peak = peak_memory_mb()
+                print(f"Partition {partition + 1}/{len(boundaries) + 1} : {len(main_df)} rows"
+                      + ("" if peak is None else f", peak memory {peak:.0f} MB"))
+        finally:
+            writer.close()
+        os.replace(tmp_output, output_path)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+        if os.path.exists(tmp_output):
+            os.remove(tmp_output)
+
+    report = pd.concat(reports).groupby(['stage', 'keys'], sort=False).sum().reset_index()
+    return report
+
+
+#------------------------------------------------------------Multi-year ingestion---------------------------------------------------------------
+# Each year is written to its own partition of the dataset (accidents/year=2022/accidents.parquet) and the
+# content hashes of its source files are kept in the manifest : a year is only rebuilt when its files changed.
+# The shared copy read by the dashboard is then published (store.publish_shared), and the invalid codes of the year
+# are listed in its quarantine report (validation.py).
+
+
+# Function returning the SHA-256 of the content of a file
+def file_hash(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Function returning the content hashes of the four source files of a year
+def source_hashes(source_dir, year):
+    return {table: file_hash(source_path(source_dir, table, year)) for table in TABLES}
+
+
+# Function to read the manifest of the dataset
+def load_manifest(dataset_dir=DATASET_DIR):
+    path = os.path.join(dataset_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+# Function to write the manifest of the dataset (written to a temporary file, then renamed)
+def save_manifest(manifest, dataset_dir=DATASET_DIR):
+    os.makedirs(dataset_dir, exist_ok=True)
+    path = os.path.join(dataset_dir, MANIFEST_NAME)
+    tmp_path = temporary_path(path)
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+# Function to record a built year in the manifest
+def record_year(year, hashes, rows, dataset_dir=DATASET_DIR):
+    manifest = load_manifest(dataset_dir)
+    manifest[str(year)] = {
+        "sources": hashes,
+        "rows": int(rows),
+        "built_at": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+    save_manifest(manifest, dataset_dir)
+
+
+# Function checking if the partition of a year is up to date with its source files and the schema of the dataset
+def is_up_to_date(year, hashes, dataset_dir=DATASET_DIR):
+    entry = load_manifest(dataset_dir).get(str(year))
+    return entry is not None and entry["sources"] == hashes and has_current_schema(year, dataset_dir)
+
+
+# Function to write the merged dataset of one year built in memory (exploration page of clean_db.py)
+def write_year(main_df, year, source_dir=".", dataset_dir=DATASET_DIR):
+    path = partition_path(year, dataset_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with dataset_lock(dataset_dir):
+        tmp_path = temporary_path(path)
+        write_parquet(main_df, tmp_path)
+        os.replace(tmp_path, path)
+        publish_shared(year, dataset_dir)
+        write_quarantine(year, dataset_dir)
+        record_year(year, source_hashes(source_dir, year), len(main_df), dataset_dir)
+    return path
+
+
+# Function to ingest several years : only the years whose source files changed are rebuilt
+# A year is rebuilt with the lock of the dataset : the refresh workers of the other server processes wait for it,
+# then find the year up to date and only read its new version
+# Returns the merge report of each rebuilt year
+def ingest_years(years, source_dir=".", dataset_dir=DATASET_DIR, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, force=False,
+                 workers=DEFAULT_WORKERS):
+    reports = {}
+    for year in years:
+        hashes = source_hashes(source_dir, year)
+        with dataset_lock(dataset_dir):
+            if not force and is_up_to_date(year, hashes, dataset_dir):
+                print(f"{year} : source files unchanged, partition kept")
+                continue
+            report = build_streaming(source_dir, year, partition_path(year, dataset_dir), memory_budget_mb, workers)
+            publish_shared(year, dataset_dir)
+            write_quarantine(year, dataset_dir)
+            record_year(year, hashes, report['rows_after'].iloc[-1], dataset_dir)
+        reports[year] = report
+    return reports
+
+
+# Function to run the ingestion from the command line
+# Usage : python ingest.py --source-dir data --years 2021 2022 --memory-budget 512
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingestion of the ONISR annual files into the accidents dataset")
+    parser.add_argument("--source-dir", default=".", help="directory of the ONISR csv files")
+    parser.add_argument("--years", type=int, nargs="+", help="years to ingest (default : every year of the source directory)")
+    parser.add_argument("--dataset-dir", default=DATASET_DIR)
+    parser.add_argument("--memory-budget", type=int, default=DEFAULT_MEMORY_BUDGET_MB, help="memory budget in MB")
+    parser.add_argument("--force", action="store_true", help="rebuild the years even if their files did not change")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="number of tables read at the same time")
+    args = parser.parse_args(argv)
+
+    years = args.years or source_years(args.source_dir)
+    reports = ingest_years(years, args.source_dir, args.dataset_dir, args.memory_budget, args.force, args.workers)
+    for year, report in reports.items():
+        print(f"Merge report of {year} :")
+        print(report.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# Data Visualization Project - NADIRE Nada
+
+import datetime
+from collections import namedtuple
+import numpy as np
+from filter_index import take
+
+
+# KPI engine of the Key numbers : the columns are prepared once per dataset version as NumPy arrays
+# (Num_Acc factorized into accident numbers 0..n-1, deaths as 0/1, age at the time of the accident),
+# then all the KPIs of a filter set are computed in one pass over the rows selected by the filter index.
+
+# Gravité 2 corresponds to 'Tué'
+KILLED = 2
+
+# accident : accident number of each row (0..n_accidents-1), dead : 1 if the person was killed,
+# grav : gravity code, age : age at the time of the accident (NaN if the year of birth is missing)
+KpiColumns = namedtuple("KpiColumns", ["accident", "n_accidents", "dead", "grav", "age"])
+
+
+# Function to prepare the KPI columns of the row-level frame (Num_Acc, grav, an_nais and the year if any)
+def build_kpi_columns(df):
+    accident, accidents = df['Num_Acc'].factorize()
+    year = df['year'].to_numpy(dtype=np.float32) if 'year' in df.columns else datetime.datetime.now().year
+    return KpiColumns(
+        accident=accident.astype(np.int32),
+        n_accidents=len(accidents),
+        dead=(df['grav'].to_numpy() == KILLED).astype(np.int8),
+        grav=df['grav'].to_numpy(dtype=np.float32),
+        age=year - df['an_nais'].to_numpy(dtype=np.float32, na_value=np.nan),
+    )
+
+
+# Function computing the KPIs of the selected rows (all the rows if positions is None)
+def compute_kpis(columns, positions=None):
+    accident, dead, grav, age = (take(values, positions) for values in (columns.accident, columns.dead, columns.grav, columns.age))
+
+    people = len(accident)
+    # People per accident : one bincount over the accident numbers, the accidents of the selection are the non-zero ones
+    people_per_accident = np.bincount(accident, minlength=columns.n_accidents)
+    people_per_accident = people_per_accident[people_per_accident > 0]
+    deaths = int(dead.sum())
+    known_age = ~np.isnan(age)
+
+    return {
+        "accidents": len(people_per_accident),
+        "people": people,
+        "deaths": deaths,
+        "death_rate": deaths / people * 100 if people else 0.0,
+        "mean_age": float(age[known_age].mean()) if known_age.any() else float("nan"),
+        "people_per_accident_variance": float(people_per_accident.var(ddof=1)) if len(people_per_accident) > 1 else 0.0,
+        "gravity_variance": float(grav.var(ddof=1)) if people > 1 else 0.0,
+    }
@@ -0,0 +1,266 @@
+# Data Visualization Project - NADIRE Nada
+
+import hashlib
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+import plotly.express as px
+from categories import decode, label_of
+from cube import slice_cube, age_bucket_label
+from timecube import slice_time_cube, TIME_DIMENSIONS
+from result_cache import cached_result
+from tracing import span
+
+
+# Compute layer of the dashboard (no Streamlit here) : each panel takes a cuboid of cube.py (or the time cube of
+# timecube.py for the time panels) and the filter spec of the page, and returns its small aggregate frame and,
+# for the plotly panels, its figure.
+# viz_project.py reads the widgets, computes the panels at once and only renders the results.
+
+# Filter spec of the page : {'catr': code or None, 'lum': code or None, 'catu': code}
+# None means that the filter is not applied
+
+# Result of a panel : its aggregate frame and its chart (the plotly figure, or the compact frame drawn with st.bar_chart)
+PanelResult = namedtuple("PanelResult", ["data", "figure"])
+
+# Decimals of the percentages sent to the browser
+PERCENT_DECIMALS = 2
+
+CUSTOM_COLORS1 = ["#FF5733", "#33FF57"]
+CUSTOM_COLORS2 = ["#7791EF", "#DD77EF"]
+CUSTOM_COLORS3 = ["#DAF7A6", "#FFC300"]
+
+
+# Function returning the filters of the cuboid for a filter of the spec (empty if it is not applied)
+def applied(filters, dimension):
+    value = filters.get(dimension)
+    return {} if value is None else {dimension: value}
+
+
+#------------------------------------------------------------Road category panels---------------------------------------------------------------
+
+# Monthly accidents over the year
+def monthly_accidents(cuboid, filters):
+    counts = slice_cube(cuboid, ['mois'], applied(filters, 'catr')).reindex(range(1, 13), fill_value=0)
+    return pd.DataFrame({"Month": decode(counts.index, 'mois'), "Number of Accidents": counts.to_numpy()})
+
+
+def monthly_figure(data, filters):
+    return px.line(data, x="Month", y="Number of Accidents", markers=True, title='Monthly Accidents',
+                   color_discrete_sequence=CUSTOM_COLORS3)
+
+
+# Accidents inside / outside agglomeration
+def agglomeration_counts(cuboid, filters):
+    counts = slice_cube(cuboid, ['agg'], applied(filters, 'catr')).sort_values(ascending=False)
+    return pd.DataFrame({"Agglomeration": decode(counts.index, 'agg'), "Count": counts.to_numpy()})
+
+
+def agglomeration_figure(data, filters):
+    return px.pie(data, names='Agglomeration', values='Count', color_discrete_sequence=CUSTOM_COLORS2, hole=0.4,
+                  title='Accidents Inside/Outside Agglomeration')
+
+
+# Share of the accidents by category of vehicle
+def vehicle_type_shares(cuboid, filters):
+    counts = slice_cube(cuboid, ['catv'], applied(filters, 'catr')).sort_values(ascending=False)
+    return pd.DataFrame({"Vehicle Type": decode(counts.index, 'catv'),
+                         "Percentage": (counts / counts.sum() * 100).to_numpy()})
+
+
+def vehicle_type_figure(data, filters):
+    road = label_of(filters['catr'], 'catr') if filters.get('catr') is not None else "All"
+    return px.bar(data, x="Percentage", y="Vehicle Type", color_discrete_sequence=CUSTOM_COLORS1,
+                  title=f"Accidents by Vehicle Type (%) - Category of Road: {road}",
+                  labels={"Vehicle Type": "Type de véhicule", "Percentage": "Percentage of accidents (%)"})
+
+
+# Count of individuals involved in accidents by gender and age bucket (5 years), without unknown gender
+def gender_age_counts(cuboid, filters):
+    grouped = slice_cube(cuboid, ['sexe', 'age_bucket'], applied(filters, 'catr'),
+                         valid=['sexe']).reset_index(name='Count of accidents')
+    grouped['sexe'] = decode(grouped['sexe'], 'sexe')
+    grouped['age'] = [age_bucket_label(bucket) for bucket in grouped['age_bucket']]
+    return grouped
+
+
+def gender_age_figure(data, filters):
+    # The buckets are ordered by age, not by label ("100+" after "95-99")
+    ages = [age_bucket_label(bucket) for bucket in sorted(data['age_bucket'].unique())]
+    return px.bar(data, x='age', y='Count of accidents', color='sexe', barmode='group',
+                  category_orders={'age': ages}, color_discrete_sequence=CUSTOM_COLORS2,
+                  title='Count of Accidents by Gender and Age', labels={'age': 'Age', 'sexe': 'Gender'})
+
+
+#------------------------------------------------------------Other panels-----------------------------------------------------------------------
+
+
+# Accidents by gravity for the selected type of usager, without unknown gravity
+def gravity_by_usager(cuboid, filters):
+    data = slice_cube(cuboid, ['grav'], applied(filters, 'catu'), valid=['grav']).reset_index()
+    data['grav'] = decode(data['grav'], 'grav')
+    return data
+
+
+# Accidents by atmospheric conditions
+def weather_counts(cuboid, filters):
+    counts = slice_cube(cuboid, ['atm'], applied(filters, 'lum'))
+    return pd.DataFrame({"Conditions Atmosphériques": decode(counts.index, 'atm'), "Number of Accidents": counts.to_numpy()})
+
+
+def weather_figure(data, filters):
+    return px.histogram(data, x='Conditions Atmosphériques', y='Number of Accidents',
+                        color_discrete_sequence=CUSTOM_COLORS2,
+                        labels={'Conditions Atmosphériques': 'Weather Conditions'},
+                        title='Number of Accidents by Weather Conditions')
+
+
+# Accidents by route type, without unknown route types (missing, or 0 which is not a code of dico.py)
+def trajet_counts(cuboid, filters):
+    counts = slice_cube(cuboid, ['trajet'], applied(filters, 'lum'), valid=['trajet'])
+    return pd.DataFrame({"Route type": decode(counts.index, 'trajet'), "Number of Accidents": counts.to_numpy()})
+
+
+def trajet_figure(data, filters):
+    return px.histogram(data, x='Route type', y='Number of Accidents', color_discrete_sequence=CUSTOM_COLORS3,
+                        title='Number of Accidents by Route type')
+
+
+#------------------------------------------------------------Time panels------------------------------------------------------------------------
+# The time panels slice the time cube (accidents per month x weekday x hour), with the filters of the sidebar
+
+
+# Accidents by weekday and hour of the day (one row per weekday x hour, in the order of the weekdays)
+def hour_weekday_counts(time_cube, filters):
+    counts = slice_time_cube(time_cube, ('weekday', 'hour'), {**applied(filters, 'catr'), **applied(filters, 'lum')})
+    weekdays, hours = np.indices(counts.shape)
+    return pd.DataFrame({"Weekday": decode(weekdays.ravel(), 'weekday'), "Hour": hours.ravel(),
+                         "Number of Accidents": counts.ravel()})
+
+
+def hour_weekday_figure(data, filters):
+    weekdays = data["Weekday"].unique()
+    counts = data["Number of Accidents"].to_numpy().reshape(len(weekdays), -1)
+    return px.imshow(counts, x=list(range(counts.shape[1])), y=list(weekdays), aspect="auto",
+                     color_continuous_scale="YlOrRd", title='Accidents by Hour and Weekday',
+                     labels={"x": "Hour", "y": "Weekday", "color": "Number of Accidents"})
+
+
+# Accidents by hour of the day
+def hourly_accidents(time_cube, filters):
+    counts = slice_time_cube(time_cube, ('hour',), {**applied(filters, 'catr'), **applied(filters, 'lum')})
+    return pd.DataFrame({"Hour": np.arange(len(counts)), "Number of Accidents": counts})
+
+
+def hourly_figure(data, filters):
+    return px.line(data, x="Hour", y="Number of Accidents", markers=True, title='Accidents by Hour of the Day',
+                   color_discrete_sequence=CUSTOM_COLORS1)
+
+
+#------------------------------------------------------------Compact charts---------------------------------------------------------------------
+# The numbers sent to the browser are made compact : counts in the smallest integer type that holds them,
+# percentages rounded, and the frames of st.bar_chart reduced to the drawn columns with one row per bar.
+
+
+# Function returning a copy of an aggregate frame with compact numbers (small integers, rounded percentages)
+def compact_numbers(data):
+    data = data.copy()
+    for column in data.columns:
+        if data[column].dtype.kind in "iu":
+            data[column] = pd.to_numeric(data[column], downcast="integer")
+        elif data[column].dtype.kind == "f":
+            data[column] = data[column].round(PERCENT_DECIMALS)
+    return data
+
+
+# Function returning the chart function of a st.bar_chart panel : the sum of y for each bar x
+def bar_chart_frame(x, y):
+    def chart(data, filters):
+        counts = data.groupby(x, sort=False)[y].sum()
+        return pd.to_numeric(counts, downcast="integer").reset_index()
+    return chart
+
+
+#------------------------------------------------------------Departments by range---------------------------------------------------------------
+# One row per department (about 100) instead of the rows of the dataset : the summary is computed once per
+# dataset version, each count is sorted once, and the range of the sliders is found by binary search.
+
+DEPARTMENT_MEASURES = {"Accidents": "accidents", "People": "people"}
+
+
+# Function computing the number of distinct accidents and of people of each department
+# Returns {measure: Series of the counts sorted in ascending order, indexed by the name of the department}
+def department_summary(num_acc, dep):
+    dep_codes, departments = pd.factorize(dep, sort=True)
+    # An accident has one department : its first row gives the department of each distinct Num_Acc
+    _, first_rows = np.unique(pd.factorize(num_acc)[0], return_index=True)
+    counts = pd.DataFrame({
+        "accidents": np.bincount(dep_codes[first_rows], minlength=len(departments)),
+        "people": np.bincount(dep_codes, minlength=len(departments)),
+    }, index=decode(np.asarray(departments), 'dep'), dtype=np.int32)
+    return {measure: counts[measure].sort_values(kind="stable") for measure in counts.columns}
+
+
+# Function returning the departments whose count is in [low, high] (binary search on the sorted counts)
+def departments_in_range(counts, low, high):
+    values = counts.to_numpy()
+    start = np.searchsorted(values, low, side="left")
+    end = np.searchsorted(values, high, side="right")
+    return counts.iloc[start:end]
+
+
+#------------------------------------------------------------Panel registry---------------------------------------------------------------------
+
+# Panels of the dashboard : name -> (dimensions of the cuboid, compute function, chart function)
+# The time panels read the time cube (TIME_DIMENSIONS) instead of a cuboid
+PANELS = {
+    "monthly": (("catr", "mois"), monthly_accidents, monthly_figure),
+    "agglomeration": (("catr", "agg"), agglomeration_counts, agglomeration_figure),
+    "vehicle_type": (("catr", "catv"), vehicle_type_shares, vehicle_type_figure),
+    "gender_age": (("catr", "sexe", "age_bucket"), gender_age_counts, gender_age_figure),
+    "gravity": (("grav", "catu"), gravity_by_usager, bar_chart_frame("grav", "count")),
+    "weather": (("lum", "atm"), weather_counts, weather_figure),
+    "trajet": (("lum", "trajet"), trajet_counts, trajet_figure),
+    "hour_weekday": (TIME_DIMENSIONS, hour_weekday_counts, hour_weekday_figure),
+    "hourly": (TIME_DIMENSIONS, hourly_accidents, hourly_figure),
+}
+
+# Filters shown by the chart of a panel (in its title) : they are part of the key of its figure
+FIGURE_OPTIONS = {"vehicle_type": ("catr",)}
+
+# Function returning the dimensions of the cuboids needed by some panels
+def required_cuboids(names=tuple(PANELS)):
+    return {PANELS[name][0] for name in names}
+
+
+# Function returning the key of the chart of a panel : hash of its aggregate frame and of the options of the chart
+def figure_key(name, data, filters):
+    digest = hashlib.sha1(name.encode())
+    digest.update(repr([(dim, filters.get(dim)) for dim in FIGURE_OPTIONS.get(name, ())]).encode())
+    digest.update(repr(list(data.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+# Function returning the chart of a panel, built only if the same aggregate and options were not charted before
+# The charts are kept in the result cache shared by the sessions (result_cache.py)
+def cached_figure(name, data, filters):
+    return cached_result("figure", (figure_key(name, data, filters),),
+                         lambda: PANELS[name][2](compact_numbers(data), filters))
+
+
+# Function computing one panel from its cuboid
+def compute_panel(name, cuboid, filters):
+    dimensions, compute, build_figure = PANELS[name]
+    with span(f"panel.{name}") as record:
+        data = compute(cuboid, filters)
+        record["rows"] = len(data)
+        figure = cached_figure(name, data, filters)
+    return PanelResult(data, figure)
+
+
+# Function computing several panels, one after the other : each one is a few pandas operations on a small
+# cuboid, that hold the GIL, so a pool of threads only added its overhead
+# cuboids is {dimensions: cuboid} (see required_cuboids), the result is {name: PanelResult}
+def compute_panels(cuboids, filters, names=tuple(PANELS)):
+    return {name: compute_panel(name, cuboids[PANELS[name][0]], filters) for name in names}
@@ -0,0 +1,43 @@
+# Data Visualization Project - NADIRE Nada
+
+import math
+from collections import namedtuple
+import numpy as np
+
+
+# Paginated preview of a dataframe (no Streamlit here) : the rows are filtered and sorted on the server,
+# and only the rows of the requested page are returned to be displayed, instead of the whole frame.
+
+PAGE_SIZES = (20, 50, 100)
+
+# rows : the rows of the page, n_rows : number of rows selected by the filter, n_pages : number of pages
+PreviewPage = namedtuple("PreviewPage", ["rows", "n_rows", "n_pages"])
+
+
+# Function returning the mask of the rows of a column matching a filter value
+# Numeric columns are compared to the number, the other columns contain the text (case insensitive)
+def filter_mask(column, value):
+    if column.dtype.kind in "iuf":
+        try:
+            return (column == float(value)).to_numpy(dtype=bool, na_value=False)
+        except ValueError:
+            return np.zeros(len(column), dtype=bool)
+    return column.astype(str).str.contains(value, case=False, regex=False).to_numpy(dtype=bool, na_value=False)
+
+
+# Function returning the positions of the rows in the order of a column (missing values last)
+def sort_positions(column, ascending=True):
+    values = column.reset_index(drop=True)
+    return values.sort_values(ascending=ascending, kind="stable", na_position="last").index.to_numpy()
+
+
+# Function returning one page of a dataframe, filtered then sorted (page starts at 1)
+def preview_page(df, page=1, page_size=PAGE_SIZES[0], sort_by=None, ascending=True, filter_column=None, filter_value=""):
+    positions = sort_positions(df[sort_by], ascending) if sort_by is not None else np.arange(len(df))
+    if filter_column is not None and filter_value != "":
+        mask = filter_mask(df[filter_column], filter_value)
+        positions = positions[mask[positions]]
+    n_pages = max(1, math.ceil(len(positions) / page_size))
+    page = min(max(page, 1), n_pages)
+    rows = df.iloc[positions[(page - 1) * page_size:page * page_size]]
+    return PreviewPage(rows, len(positions), n_pages)
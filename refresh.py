@@ -0,0 +1,140 @@
+# Data Visualization Project - NADIRE Nada
+
+import datetime
+import hashlib
+import os
+import threading
+import time
+import traceback
+from collections import namedtuple, OrderedDict
+from ingest import ingest_years, source_years, source_path, TABLES
+from store import available_years, partition_path, year_dir, dataset_key, CSV_PATH, CURRENT_NAME, DATASET_DIR
+from tracing import span
+
+
+# Background refresh of the dataset : a worker thread polls the source files of ingest.py and the cleaned
+# output (the partitions of the dataset, or accidents.csv). When they change, it rebuilds the changed years
+# and their shared copy, builds the aggregates of the new version through the warm function of the dashboard,
+# and only then switches the version served to the sessions : no session waits for a rebuild.
+
+POLL_SECONDS = 5
+
+# Number of year selections of the sessions warmed at each refresh (the most recently used ones), besides the default one
+MAX_SELECTIONS = 4
+
+# Version served by the dashboard : the dataset key of each year selection that was warmed,
+# the time of the switch and the duration of the build (rebuild of the store + aggregates)
+ServedVersion = namedtuple("ServedVersion", ["datasets", "built_at", "build_seconds"])
+
+# The served version is replaced as a whole, so a session reads either the old one or the new one
+_served = None
+# Year selections of the sessions (existing years only), in order of use, warmed at each refresh
+_selections = OrderedDict()
+_lock = threading.Lock()
+_worker = None
+
+
+# Function returning the size and modification time of the watched files (source files and cleaned output)
+def watched_files(source_dir=".", dataset_dir=DATASET_DIR):
+    paths = [CSV_PATH]
+    if os.path.isdir(source_dir):
+        paths += [source_path(source_dir, table, year) for year in source_years(source_dir) for table in TABLES]
+    for year in available_years(dataset_dir):
+        paths += [partition_path(year, dataset_dir), os.path.join(year_dir(year, dataset_dir), CURRENT_NAME)]
+    signature = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        signature[path] = (stat.st_size, stat.st_mtime_ns)
+    return signature
+
+
+# Function returning the default year selection of the dashboard (the last year, or accidents.csv)
+def default_selection(dataset_dir=DATASET_DIR):
+    return tuple(available_years(dataset_dir)[-1:])
+
+
+# Function to record the use of a year selection (only the MAX_SELECTIONS most recently used ones are kept)
+def remember_selection(years):
+    with _lock:
+        _selections[years] = None
+        _selections.move_to_end(years)
+        while len(_selections) > MAX_SELECTIONS:
+            _selections.popitem(last=False)
+
+
+# Function returning the dataset key served for a year selection
+# Before the first refresh, or for a selection that was never warmed, the key is read from the files
+# (a selection with a year that is not in the dataset is not warmed)
+def served_dataset(years, dataset_dir=DATASET_DIR):
+    years = tuple(sorted(years))
+    served = _served
+    if served is not None and years in served.datasets:
+        remember_selection(years)
+        return served.datasets[years]
+    if set(years) <= set(available_years(dataset_dir)):
+        remember_selection(years)
+    return dataset_key(years, dataset_dir)
+
+
+# Function returning the served version (None before the first refresh)
+def served_version():
+    return _served
+
+
+# Function returning a short label of a dataset version for the sidebar
+def version_label(dataset):
+    return hashlib.sha1(dataset.version.encode()).hexdigest()[:8]
+
+
+# Function to rebuild the dataset and its aggregates, then switch the served version
+# warm(dataset) builds the caches of the dashboard for a dataset key
+def refresh(warm, source_dir=".", dataset_dir=DATASET_DIR):
+    global _served
+    start_time = time.perf_counter()
+    with span("refresh") as record:
+        # Only the years whose source files changed are rebuilt (manifest of ingest.py)
+        if os.path.isdir(source_dir) and source_years(source_dir):
+            ingest_years(source_years(source_dir), source_dir, dataset_dir)
+        with _lock:
+            selections = set(_selections) | {default_selection(dataset_dir)}
+        years = set(available_years(dataset_dir))
+        datasets = {}
+        for selection in selections:
+            if not set(selection) <= years:
+                continue
+            datasets[selection] = dataset_key(selection, dataset_dir)
+            warm(datasets[selection])
+        record["rows"] = len(datasets)
+    _served = ServedVersion(datasets, datetime.datetime.now(), time.perf_counter() - start_time)
+    return _served
+
+
+# Function polling the watched files and refreshing the dataset when they change (body of the worker thread)
+def watch(warm, source_dir=".", dataset_dir=DATASET_DIR, poll_seconds=POLL_SECONDS, stop=None):
+    stop = stop or threading.Event()
+    signature = None
+    while not stop.is_set():
+        current = watched_files(source_dir, dataset_dir)
+        if current != signature:
+            try:
+                refresh(warm, source_dir, dataset_dir)
+            except Exception:
+                # The previous version stays served, the refresh is tried again at the next change
+                traceback.print_exc()
+            # The refresh writes the cleaned output : the files are read again so that it is not seen as a change
+            signature = watched_files(source_dir, dataset_dir)
+        stop.wait(poll_seconds)
+
+
+# Function to start the refresh worker of the process (once)
+def start_worker(warm, source_dir=".", dataset_dir=DATASET_DIR, poll_seconds=POLL_SECONDS):
+    global _worker
+    with _lock:
+        if _worker is None:
+            _worker = threading.Thread(target=watch, args=(warm, source_dir, dataset_dir, poll_seconds),
+                                       name="refresh", daemon=True)
+            _worker.start()
+    return _worker
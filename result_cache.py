@@ -0,0 +1,94 @@
+# Data Visualization Project - NADIRE Nada
+
+import threading
+import time
+from collections import Counter, OrderedDict
+from urllib.parse import urlencode, parse_qsl
+
+
+# Result cache shared by all the sessions of the server process : the results of the views of the dashboard
+# (Key numbers, panels and their figures, cells of the map, answers of api.py) are kept per dataset version and
+# canonical filter key, so a view computed for one visitor is served to the next ones without computing it again.
+# The cache is bounded (the least recently used results are evicted), a result expires after its time to live,
+# and the hits and misses are counted per kind of result.
+
+RESULT_CACHE_SIZE = 1024
+RESULT_TTL_SECONDS = 3600
+
+# Filter state of the dashboard, in the order of the canonical key and of the URL query parameters :
+# category of road, luminosity, usager type of the gravity panel, interval of the departments panel
+FILTER_PARAMS = ("catr", "lum", "catu", "dep_min", "dep_max")
+
+# key -> (expiry time, result), in order of use
+_results = OrderedDict()
+_lock = threading.Lock()
+# kind -> {"hits": n, "misses": n}
+_stats = {}
+# canonical filter key -> number of page views (most viewed filter states, warmed at each refresh)
+_views = Counter()
+
+
+# Function returning the filter state of URL query parameters ({name: value}) : the unknown parameters
+# and the values that are not integers are dropped
+def parse_filters(params):
+    filters = {}
+    for name in FILTER_PARAMS:
+        try:
+            filters[name] = int(params[name])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return filters
+
+
+# Function returning the canonical key of a filter state : the applied filters (None is not applied)
+# in the order of FILTER_PARAMS, as a query string ("catr=3&lum=1"), the same for the URL and the cache
+def filter_key(filters):
+    return urlencode([(name, filters[name]) for name in FILTER_PARAMS if filters.get(name) is not None])
+
+
+# Function returning the filter state of a canonical key ("catr=3&lum=1" -> {"catr": 3, "lum": 1})
+def parse_filter_key(key):
+    return parse_filters(dict(parse_qsl(key)))
+
+
+# Function counting a page view of a filter state
+def record_view(key):
+    with _lock:
+        _views[key] += 1
+
+
+# Function returning the most viewed filter states (canonical keys)
+def popular_views(count):
+    with _lock:
+        return [key for key, _ in _views.most_common(count)]
+
+
+# Function returning the result of a key, computed by compute() if it is not in the cache or has expired
+# kind groups the hits and misses of the results of the same type ("kpis", "panel", "map"...)
+def cached_result(kind, key, compute, ttl=RESULT_TTL_SECONDS, cache_size=RESULT_CACHE_SIZE):
+    key = (kind,) + tuple(key)
+    now = time.monotonic()
+    with _lock:
+        stats = _stats.setdefault(kind, {"hits": 0, "misses": 0})
+        entry = _results.get(key)
+        if entry is not None and entry[0] > now:
+            _results.move_to_end(key)
+            stats["hits"] += 1
+            return entry[1]
+        stats["misses"] += 1
+    # Computed outside the lock : the other sessions are not blocked by a slow result
+    result = compute()
+    with _lock:
+        _results[key] = (now + ttl, result)
+        _results.move_to_end(key)
+        while len(_results) > cache_size:
+            _results.popitem(last=False)
+    return result
+
+
+# Function returning the size of the cache and the hit rate of each kind of result
+def cache_stats():
+    with _lock:
+        kinds = {kind: {**stats, "hit_rate": round(stats["hits"] / max(stats["hits"] + stats["misses"], 1), 3)}
+                 for kind, stats in _stats.items()}
+        return {"size": len(_results), "max_size": RESULT_CACHE_SIZE, "ttl_seconds": RESULT_TTL_SECONDS, "kinds": kinds}
@@ -0,0 +1,157 @@
+# Data Visualization Project - NADIRE Nada
+
+import numpy as np
+import pandas as pd
+from dico import dico_mapping
+
+
+# Registry of the compact dtypes of the accident tables, applied when the files are read.
+# The coded columns of dico.py are stored in the smallest integer type that holds their codes,
+# the departments as a categorical and the year of birth on 16 bits, instead of the
+# int64 / float64 / object columns that pd.read_csv infers.
+
+# Code of the missing values in the ONISR files ("Non renseigné")
+MISSING_CODE = -1
+
+# Code grouping the codes that are not in dico.py in the cuboids ("Autre"), apart from the missing values
+OTHER_CODE = -2
+
+# Code of the missing departments in the cuboids : the department codes are text ("2A", "971")
+MISSING_DEPARTMENT = str(MISSING_CODE)
+
+INTEGER_DTYPES = ("int8", "int16", "int32", "int64")
+
+
+# Function returning the smallest integer dtype that holds the codes of a column of dico.py and MISSING_CODE
+def code_dtype(codes):
+    low, high = min(min(codes), MISSING_CODE), max(codes)
+    for dtype in INTEGER_DTYPES:
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return dtype
+    raise ValueError(f"The codes {low}..{high} do not fit in a 64 bits integer")
+
+
+# Coded columns of dico.py (integer codes) with their dtype : {'lum': 'int8', 'catv': 'int8', ...}
+CODE_DTYPES = {
+    column: code_dtype(mapping)
+    for column, mapping in dico_mapping.items()
+    if all(isinstance(code, int) for code in mapping)
+}
+
+# Coded columns of the source tables without labels in dico.py (same small codes, -1 when missing)
+CODE_DTYPES.update({
+    column: "int8"
+    for column in ("jour", "col", "circ", "vosp", "prof", "plan", "infra", "situ", "senc", "obs", "obsm",
+                   "choc", "manv", "motor", "place", "secu1", "secu2", "secu3", "locp", "etatp")
+})
+CODE_DTYPES.update({"an": "int16", "vma": "int16"})
+
+# Hour of the accident (0-23), derived from hrmn at ingestion, -1 when missing (the weekday has its labels in dico.py)
+CODE_DTYPES["hour"] = "int8"
+
+# dtypes of the other columns of the accident tables
+# an_nais can be missing in the usagers file, so it is a nullable integer
+COLUMN_DTYPES = {
+    **CODE_DTYPES,
+    "Num_Acc": "int64",
+    "an_nais": "Int16",
+    "dep": "category",
+    "lat": "float32",
+    "long": "float32",
+}
+
+# Columns read as text ("813 952" identifiers, "16:40" hours), whatever the content of the file
+TEXT_COLUMNS = ("id_usager", "id_vehicule", "hrmn")
+
+# Coordinates of the accidents (caracteristiques), written with a decimal comma in the files ("48,89621")
+# They are read as text and stored as 32 bits floats (NaN when missing)
+COORDINATE_COLUMNS = ("lat", "long")
+
+
+# Function returning the dtype given to pd.read_csv for a column
+# The codes are read as nullable integers (a blank cell is not a parse error) and filled by apply_schema
+def read_dtype(column):
+    dtype = COLUMN_DTYPES[column]
+    return dtype.capitalize() if column in CODE_DTYPES else dtype
+
+
+# Function returning the dtype argument of pd.read_csv for the columns of the registry
+# (all of them if columns is None), so the columns are parsed directly into their compact dtype
+def read_dtypes(columns=None):
+    known = list(COLUMN_DTYPES) + list(TEXT_COLUMNS)
+    columns = known if columns is None else [column for column in columns if column in known]
+    return {column: str if column in TEXT_COLUMNS + COORDINATE_COLUMNS else read_dtype(column) for column in columns}
+
+
+# Function to convert the columns of a dataframe that are in the registry to their compact dtype
+# The missing codes are replaced by MISSING_CODE
+def apply_schema(df):
+    for column in df.columns:
+        if column not in COLUMN_DTYPES:
+            continue
+        dtype = COLUMN_DTYPES[column]
+        if column in CODE_DTYPES:
+            values = df[column]
+            # Columns already stored with their dtype are kept as they are (no copy of a memory-mapped column)
+            if values.dtype == dtype:
+                continue
+            if values.isna().any():
+                values = values.fillna(MISSING_CODE)
+            df[column] = values.astype(dtype)
+        elif column in COORDINATE_COLUMNS:
+            if df[column].dtype != dtype:
+                df[column] = parse_coordinates(df[column])
+        elif df[column].dtype != dtype:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+# Function converting coordinates written with a decimal comma ("48,89621") into 32 bits floats (NaN when missing)
+def parse_coordinates(values):
+    if values.dtype.kind not in "iuf":
+        values = pd.to_numeric(values.astype(str).str.strip().str.replace(",", ".", regex=False), errors="coerce")
+    return values.astype("float32")
+
+
+# Function returning the hour (0-23) of hrmn values as int8 codes, MISSING_CODE when missing or out of range
+# hrmn is "16:40" since 2019 and the integer 1640 before ("5" for 00:05) : both read as the number 1640
+def parse_hours(hrmn):
+    if hrmn.dtype.kind not in "iuf":
+        hrmn = pd.to_numeric(hrmn.astype(str).str.strip().str.replace(":", "", regex=False), errors="coerce")
+    hours = hrmn.to_numpy(dtype=np.float64, na_value=np.nan) // 100
+    return np.where((hours >= 0) & (hours <= 23), hours, MISSING_CODE).astype(np.int8)
+
+
+# Function returning the weekday (0 : Monday - 6 : Sunday) of the dates an / mois / jour as int8 codes,
+# MISSING_CODE when the date is missing or does not exist (the year is written on 2 digits in some releases)
+# The dates are computed on whole arrays with the day counts of numpy.datetime64
+def parse_weekdays(an, mois, jour):
+    year, month, day = (values.to_numpy(dtype=np.int64, na_value=MISSING_CODE) for values in (an, mois, jour))
+    year = np.where((year >= 0) & (year < 100), year + 2000, year)
+    valid = (year >= 1970) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+    months = ((year - 1970) * 12 + month - 1)[valid].astype("datetime64[M]")
+    dates = months.astype("datetime64[D]") + (day[valid] - 1)
+    # A day past the end of its month (31 of April) moves to the next month : it is not a date
+    exists = dates.astype("datetime64[M]") == months
+    weekdays = np.full(len(year), MISSING_CODE, dtype=np.int8)
+    # Day 0 of datetime64 (1970-01-01) was a Thursday (3)
+    weekdays[np.flatnonzero(valid)[exists]] = (dates[exists].astype(np.int64) + 3) % 7
+    return weekdays
+
+
+# Function returning the memory of each column of a dataframe in MB
+def column_memory_mb(df):
+    return df.memory_usage(index=False, deep=True) / (1024 * 1024)
+
+
+# Function comparing the dtype and the memory of each column of the same data read in two ways
+def memory_report(before, after):
+    report = pd.DataFrame({
+        "dtype_before": before.dtypes.astype(str),
+        "mb_before": column_memory_mb(before),
+        "dtype_after": after.dtypes.astype(str),
+        "mb_after": column_memory_mb(after),
+    })
+    report.loc["total"] = ["", report["mb_before"].sum(), "", report["mb_after"].sum()]
+    report["ratio"] = report["mb_before"] / report["mb_after"]
+    return report.round(3)
@@ -0,0 +1,254 @@
+# Data Visualization Project - NADIRE Nada
+
+import contextlib
+import glob
+import os
+import threading
+import time
+from collections import namedtuple
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# Columnar store of the merged accidents dataset (written by clean_db.py, read by viz_project.py)
+
+CSV_PATH = "accidents.csv"
+PARQUET_PATH = "accidents.parquet"
+
+# The dataset is partitioned by year : accidents/year=2022/accidents.parquet
+DATASET_DIR = "accidents"
+
+# Shared copy of each year, published next to its partition as an uncompressed Arrow IPC file that every
+# session and every server process maps into memory (accidents/year=2022/accidents-<version>.arrow).
+# CURRENT_NAME holds the published version : a new version is written to its own file, then CURRENT is
+# replaced atomically, so the readers of the previous version keep a valid mapping until they drop it.
+SHARED_PREFIX = "accidents-"
+CURRENT_NAME = "CURRENT"
+# Number of published versions kept on disk (the current one and the previous one)
+KEEP_VERSIONS = 2
+
+# Lock file of the dataset (accidents/.lock) : every server process runs a refresh worker, one process at a time
+# rebuilds a year and publishes its shared copy, the others wait and then find the year up to date
+LOCK_NAME = ".lock"
+LOCK_RETRY_SECONDS = 1
+
+# Years and version of the loaded dataset, used as cache key by the dashboard
+Dataset = namedtuple("Dataset", ["years", "version"])
+
+# Explicit schema of the merged dataset : the coded columns of dico.py fit in small integers
+ACCIDENTS_SCHEMA = pa.schema([
+    ("Num_Acc", pa.int64()),
+    ("mois", pa.int8()),
+    ("weekday", pa.int8()),
+    ("hour", pa.int8()),
+    ("lum", pa.int8()),
+    ("dep", pa.string()),
+    ("agg", pa.int8()),
+    ("int", pa.int8()),
+    ("atm", pa.int8()),
+    ("lat", pa.float32()),
+    ("long", pa.float32()),
+    ("catr", pa.int8()),
+    ("surf", pa.int8()),
+    ("catv", pa.int8()),
+    ("id_usager", pa.string()),
+    ("catu", pa.int8()),
+    ("grav", pa.int8()),
+    ("sexe", pa.int8()),
+    ("an_nais", pa.int16()),
+    ("trajet", pa.int8()),
+    ("invalid_codes", pa.uint16()),
+])
+
+
+# Function to convert a DataFrame into an Arrow table following the explicit schema
+def to_arrow_table(df, schema=ACCIDENTS_SCHEMA):
+    return pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+
+
+# Function to write the dataset as a compressed Parquet file
+def write_parquet(df, path=PARQUET_PATH, compression="zstd"):
+    pq.write_table(to_arrow_table(df), path, compression=compression)
+    return path
+
+
+# Function to open a Parquet file that is written piece by piece (streaming build)
+def open_parquet_writer(path, compression="zstd"):
+    return pq.ParquetWriter(path, ACCIDENTS_SCHEMA, compression=compression)
+
+
+# Function to append a piece of the dataset to a Parquet file opened with open_parquet_writer
+def append_parquet(writer, df):
+    writer.write_table(to_arrow_table(df))
+
+
+# Function returning the directory of the partition of one year
+def year_dir(year, dataset_dir=DATASET_DIR):
+    return os.path.join(dataset_dir, f"year={year}")
+
+
+# Function returning the path of the partition of one year
+def partition_path(year, dataset_dir=DATASET_DIR):
+    return os.path.join(year_dir(year, dataset_dir), PARQUET_PATH)
+
+
+# Function checking that the partition of a year has the columns of the current schema
+# (a partition written before a column was added to ACCIDENTS_SCHEMA has to be rebuilt)
+def has_current_schema(year, dataset_dir=DATASET_DIR):
+    path = partition_path(year, dataset_dir)
+    return os.path.exists(path) and pq.read_schema(path).names == ACCIDENTS_SCHEMA.names
+
+
+# Function returning a temporary path next to a file, unique to the writer (process and thread) :
+# the file is written there, then renamed, so a reader never sees a partial file and two writers never share one
+def temporary_path(path):
+    return f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+
+
+# Context manager holding the lock of the dataset (with dataset_lock(): ...), across the processes of the machine
+@contextlib.contextmanager
+def dataset_lock(dataset_dir=DATASET_DIR):
+    os.makedirs(dataset_dir, exist_ok=True)
+    with open(os.path.join(dataset_dir, LOCK_NAME), "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            # msvcrt gives up after 10 seconds : the lock is requested again until it is free
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(LOCK_RETRY_SECONDS)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+# Function returning the years available in the dataset
+def available_years(dataset_dir=DATASET_DIR):
+    if not os.path.isdir(dataset_dir):
+        return []
+    years = [int(name[len("year="):]) for name in os.listdir(dataset_dir) if name.startswith("year=")]
+    return sorted(year for year in years if os.path.exists(partition_path(year, dataset_dir)))
+
+
+#------------------------------------------------------------Shared memory-mapped copy-----------------------------------------------------------
+
+
+# Function returning the published version of one year (None if it has not been published)
+def shared_version(year, dataset_dir=DATASET_DIR):
+    try:
+        with open(os.path.join(year_dir(year, dataset_dir), CURRENT_NAME)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+# Function returning the path of the shared copy of one version of a year
+def shared_path(year, version, dataset_dir=DATASET_DIR):
+    return os.path.join(year_dir(year, dataset_dir), f"{SHARED_PREFIX}{version}.arrow")
+
+
+# Function to publish the shared copy of one year from its Parquet partition (called with the lock of the dataset)
+# The version is the size and modification time of the partition, the file is written before the swap of CURRENT
+def publish_shared(year, dataset_dir=DATASET_DIR):
+    path = partition_path(year, dataset_dir)
+    stat = os.stat(path)
+    version = f"{stat.st_size}.{stat.st_mtime_ns}"
+    target = shared_path(year, version, dataset_dir)
+    # Uncompressed and in one record batch, so that each column is one contiguous array of the mapping
+    # The department is dictionary-encoded : it is read as a category (int16 codes) instead of one string per row
+    table = pq.read_table(path).combine_chunks()
+    departments = table.schema.get_field_index("dep")
+    # (dictionary_encode then int16 indices : pyarrow 13 has no cast from string to dictionary)
+    encoded = table["dep"].combine_chunks().dictionary_encode()
+    encoded = pa.DictionaryArray.from_arrays(encoded.indices.cast(pa.int16()), encoded.dictionary)
+    table = table.set_column(departments, "dep", encoded)
+    tmp_target = temporary_path(target)
+    with pa.ipc.new_file(tmp_target, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_target, target)
+
+    current = os.path.join(year_dir(year, dataset_dir), CURRENT_NAME)
+    tmp_current = temporary_path(current)
+    with open(tmp_current, "w") as f:
+        f.write(version)
+    os.replace(tmp_current, current)
+    prune_shared(year, dataset_dir)
+    return version
+
+
+# Function to remove the old versions of the shared copy of a year (the processes that still map them keep their data)
+def prune_shared(year, dataset_dir=DATASET_DIR, keep=KEEP_VERSIONS):
+    paths = glob.glob(os.path.join(year_dir(year, dataset_dir), f"{SHARED_PREFIX}*.arrow"))
+    current = shared_path(year, shared_version(year, dataset_dir), dataset_dir)
+    old = sorted((path for path in paths if path != current), key=os.path.getmtime, reverse=True)
+    for path in old[keep - 1:]:
+        os.remove(path)
+
+
+# Function returning the Arrow table of one year : the shared copy mapped into memory (zero-copy, the pages
+# are shared with the other processes through the page cache), or the Parquet partition if it is not published
+# A version can be requested (the version served by the dashboard), the current one is read if it was pruned
+def read_year_table(year, columns=None, dataset_dir=DATASET_DIR, version=None):
+    columns = list(columns) if columns is not None else None
+    path = shared_path(year, version, dataset_dir) if version is not None else None
+    if path is None or not os.path.exists(path):
+        version = shared_version(year, dataset_dir)
+        path = shared_path(year, version, dataset_dir) if version is not None else None
+    if path is not None:
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        return table.select(columns) if columns is not None else table
+    return pq.read_table(partition_path(year, dataset_dir), columns=columns)
+
+
+# Function to read the partitions of some years (with column projection) into one frame with a 'year' column
+# split_blocks keeps one array per column, so the integer columns of a single year are views of the mapping
+def read_dataset(years, columns=None, dataset_dir=DATASET_DIR, versions=None):
+    versions = versions or [None] * len(years)
+    frames = []
+    for year, version in zip(years, versions):
+        df = read_year_table(year, columns, dataset_dir, version).to_pandas(split_blocks=True)
+        df["year"] = pd.Series(year, index=df.index, dtype="int16")
+        frames.append(df)
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+
+# Function returning the version of one year : the version of its shared copy, which only changes when
+# CURRENT is swapped, or the size and modification time of its partition if it is not published
+def year_version(year, dataset_dir=DATASET_DIR):
+    version = shared_version(year, dataset_dir)
+    if version is None:
+        stat = os.stat(partition_path(year, dataset_dir))
+        version = f"{stat.st_size}.{stat.st_mtime_ns}"
+    return version
+
+
+# Function returning an identifier of the stored years that changes at every rebuild (used as cache key)
+def dataset_version(years, dataset_dir=DATASET_DIR):
+    if not years:
+        stat = os.stat(CSV_PATH)
+        return f"{stat.st_size}.{stat.st_mtime_ns}"
+    return "-".join(year_version(year, dataset_dir) for year in years)
+
+
+# Function returning the version of each year of a dataset key (the inverse of dataset_version)
+def dataset_versions(dataset):
+    return dataset.version.split("-") if dataset.years else []
+
+
+# Function returning the cache key of the dataset made of some years
+def dataset_key(years, dataset_dir=DATASET_DIR):
+    years = tuple(sorted(years))
+    return Dataset(years, dataset_version(years, dataset_dir))
@@ -0,0 +1,80 @@
+# Data Visualization Project - NADIRE Nada
+
+from collections import namedtuple
+import numpy as np
+
+
+# Time cube of the accidents dataset : the number of accidents of every month x weekday x hour is counted once
+# per dataset version into a dense array, with one array per combination of the codes of the sidebar filters
+# (category of road, luminosity). The heatmap hour x weekday and the trend over the hours of the day are sums
+# over the axes of this small array (about 100 000 counts), like the monthly line chart reads its cuboid.
+
+# Filters of the sidebar (first axes of the array) and time buckets of ingest.py (last axes)
+TIME_FILTERS = ("catr", "lum")
+TIME_AXES = ("mois", "weekday", "hour")
+TIME_DIMENSIONS = TIME_FILTERS + TIME_AXES
+
+# Number of buckets of each time axis : months 1-12, weekdays 0-6 (Monday - Sunday), hours 0-23
+TIME_SIZES = {"mois": 12, "weekday": 7, "hour": 24}
+
+# Columns of the row-level frame needed to build the time cube
+TIME_COLUMNS = ("Num_Acc",) + TIME_DIMENSIONS
+
+# codes : {filter: sorted codes of its axis}, counts : accidents per [catr, lum, month, weekday, hour] (int32),
+# undated : accidents per [catr, lum] without a valid month, weekday or hour
+TimeCube = namedtuple("TimeCube", ["codes", "counts", "undated"])
+
+
+# Function returning the bucket of each row on a time axis (the months start at 1) and if it is a valid bucket
+def time_buckets(values, axis):
+    buckets = values.astype(np.int64) - (1 if axis == "mois" else 0)
+    return buckets, (buckets >= 0) & (buckets < TIME_SIZES[axis])
+
+
+# Function to build the time cube from the row-level frame (one count per accident : its first row)
+def build_time_cube(df):
+    first = (~df['Num_Acc'].duplicated()).to_numpy()
+    codes, positions = {}, []
+    for dim in TIME_FILTERS:
+        values = df[dim].to_numpy()[first]
+        codes[dim] = np.unique(values)
+        positions.append(np.searchsorted(codes[dim], values))
+    filter_shape = tuple(len(codes[dim]) for dim in TIME_FILTERS)
+
+    dated = np.ones(len(positions[0]), dtype=bool)
+    for axis in TIME_AXES:
+        buckets, valid = time_buckets(df[axis].to_numpy()[first], axis)
+        positions.append(buckets)
+        dated &= valid
+
+    # One bincount over the flat index of the cells of the array
+    shape = filter_shape + tuple(TIME_SIZES[axis] for axis in TIME_AXES)
+    cells = np.ravel_multi_index(tuple(position[dated] for position in positions), shape)
+    counts = np.bincount(cells, minlength=int(np.prod(shape))).reshape(shape).astype(np.int32)
+    undated = np.ravel_multi_index(tuple(position[~dated] for position in positions[:len(TIME_FILTERS)]), filter_shape)
+    undated = np.bincount(undated, minlength=int(np.prod(filter_shape))).reshape(filter_shape).astype(np.int32)
+    return TimeCube(codes, counts, undated)
+
+
+# Function keeping the codes of a filter spec {dimension: code, list or None} on the first axes of an array of the cube
+def select_filters(cube, counts, filters=None):
+    for position, dim in enumerate(TIME_FILTERS):
+        value = (filters or {}).get(dim)
+        if value is None:
+            continue
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        counts = counts.compress(np.isin(cube.codes[dim], list(values)), axis=position)
+    return counts
+
+
+# Function returning the counts of the accidents over some time axes for a filter spec
+# The result is an array with the axes of group_by, in the order of TIME_AXES (a number if group_by is empty)
+def slice_time_cube(cube, group_by, filters=None):
+    counts = select_filters(cube, cube.counts, filters)
+    summed = tuple(position for position, dim in enumerate(TIME_DIMENSIONS) if dim not in group_by)
+    return counts.sum(axis=summed)
+
+
+# Function returning the number of accidents of a filter spec without a valid month, weekday or hour
+def undated_count(cube, filters=None):
+    return int(select_filters(cube, cube.undated, filters).sum())
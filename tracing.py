@@ -0,0 +1,151 @@
+# Data Visualization Project - NADIRE Nada
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+import pandas as pd
+
+
+# Structured tracing of the dashboard : each traced step (loading, cube, decoding, panels) writes one
+# JSON line (a span) with its start time, duration, rows processed, cache hit/miss and peak memory.
+# Tracing is off by default : it is turned on by the environment variable ACCIDENTS_TRACE (path of the trace file).
+# Usage : python tracing.py report [traces.jsonl] prints the p50 / p95 / p99 durations of each span.
+
+TRACE_ENV = "ACCIDENTS_TRACE"
+TRACE_PATH = os.environ.get(TRACE_ENV) or None
+
+# Once the trace file is bigger than MAX_TRACE_MB, it is renamed to <path>.1 (the previous one is replaced)
+MAX_TRACE_MB = 50
+
+PERCENTILES = (50, 95, 99)
+
+# Spans that are open in the current thread (innermost last), so a span knows its parent
+# and a cached function can mark the span around it as a cache miss
+_local = threading.local()
+_write_lock = threading.Lock()
+
+
+# Function returning the peak resident memory of the process in MB (None where it is not known)
+def peak_memory_mb():
+    try:
+        import resource
+    except ImportError:
+        # The resource module only exists on POSIX systems (not on Windows)
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+# Function returning the stack of open spans of the current thread
+def open_spans():
+    if not hasattr(_local, "spans"):
+        _local.spans = []
+    return _local.spans
+
+
+# Function to append a span to the trace file (nothing is written when tracing is off)
+def write_span(record, path=TRACE_PATH):
+    if path is None:
+        return
+    line = json.dumps(record, default=str)
+    with _write_lock:
+        if os.path.exists(path) and os.path.getsize(path) > MAX_TRACE_MB * 1024 * 1024:
+            os.replace(path, f"{path}.1")
+        with open(path, "a") as trace_file:
+            trace_file.write(line + "\n")
+
+
+# Context manager tracing a block of code : with span("load_data") as record: ...
+# The block can fill record["rows"] (rows processed) and record["cache"] ("hit" / "miss")
+@contextmanager
+def span(name, path=TRACE_PATH, **attributes):
+    spans = open_spans()
+    record = {
+        "span": name,
+        "parent": spans[-1]["span"] if spans else None,
+        "start": time.time(),
+        "rows": None,
+        "cache": None,
+        **attributes,
+    }
+    spans.append(record)
+    start_time = time.perf_counter()
+    try:
+        yield record
+    except Exception as error:
+        record["error"] = repr(error)
+        raise
+    finally:
+        record["duration_ms"] = round((time.perf_counter() - start_time) * 1000, 3)
+        if path is not None:
+            peak = peak_memory_mb()
+            record["peak_memory_mb"] = None if peak is None else round(peak, 1)
+        spans.pop()
+        write_span(record, path)
+
+
+# Function to call inside the body of a cached function : the body only runs on a cache miss
+def mark_cache_miss():
+    spans = open_spans()
+    if spans:
+        spans[-1]["cache"] = "miss"
+
+
+# Decorator tracing every call of a function with span()
+# cached=True is for a function wrapped by st.cache_data / st.cache_resource : put @traced above the
+# cache decorator and call mark_cache_miss() in the body, the calls that do not run it are cache hits
+# The rows processed are the length of the result (a dataframe, a series, an array), if it has one
+def traced(name=None, cached=False, path=TRACE_PATH):
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, path, cache="hit" if cached else None) as record:
+                result = func(*args, **kwargs)
+                if hasattr(result, "__len__") and not isinstance(result, (str, dict)):
+                    record["rows"] = len(result)
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+# Function to read the spans of a trace file into a dataframe
+def read_spans(path=TRACE_PATH):
+    return pd.read_json(path, lines=True)
+
+
+# Function computing the count, p50 / p95 / p99 duration (ms) and cache hit rate of each span
+def span_report(spans):
+    durations = spans.groupby("span")["duration_ms"]
+    report = pd.DataFrame({"count": durations.size()})
+    for percentile in PERCENTILES:
+        report[f"p{percentile}_ms"] = durations.quantile(percentile / 100)
+    report["max_ms"] = durations.max()
+    cached = spans.dropna(subset=["cache"])
+    if not cached.empty:
+        report["cache_hit_rate"] = cached["cache"].eq("hit").groupby(cached["span"]).mean()
+    report["peak_memory_mb"] = spans.groupby("span")["peak_memory_mb"].max()
+    return report.sort_values(f"p{PERCENTILES[-1]}_ms", ascending=False).round(3)
+
+
+# Function to run the report command
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    path = argv[1] if len(argv) > 1 else TRACE_PATH
+    if not argv or argv[0] != "report" or path is None:
+        print(f"Usage : python tracing.py report [traces.jsonl] (default : ${TRACE_ENV})")
+        return
+    with pd.option_context("display.width", 160, "display.max_columns", None):
+        print(span_report(read_spans(path)))
+
+
+if __name__ == '__main__':
+    main()
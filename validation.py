@@ -0,0 +1,87 @@
+# Data Visualization Project - NADIRE Nada
+
+import os
+import numpy as np
+import pandas as pd
+from dico import dico_mapping
+from schema import MISSING_CODE, OTHER_CODE
+from store import read_year_table, year_dir, temporary_path, DATASET_DIR
+
+
+# Validation of the codes of the merged dataset, run once at ingestion : every coded column is checked against
+# the codes of dico.py, and the result is stored with each row as a bitmask (bit set = the code of the column is
+# missing or unknown to dico.py). The cuboids group the invalid codes of a column under MISSING_CODE (missing) and
+# OTHER_CODE (a code without label in dico.py), so the panels drop or show these groups instead of scanning the codes,
+# and the invalid codes of each year are listed in a quarantine report.
+
+# Column of the dataset holding the bitmask of the invalid codes of each row
+INVALID_CODES = "invalid_codes"
+
+# Coded columns of the merged dataset, with their bit in the bitmask (16 bits : uint16)
+VALIDATED_COLUMNS = ("mois", "lum", "dep", "agg", "int", "atm", "catr", "surf", "catv", "catu", "grav", "sexe", "trajet")
+VALIDITY_BITS = {column: np.uint16(1 << bit) for bit, column in enumerate(VALIDATED_COLUMNS)}
+
+# Quarantine report of a year : accidents/year=2022/quarantine.csv
+QUARANTINE_NAME = "quarantine.csv"
+
+
+# Function returning a boolean array : True where the code of the column is one of the codes of dico.py
+# The departments are checked on their categories (about 100), then spread to the rows by their category codes
+def valid_rows(values, column):
+    if column == "dep":
+        departments = values.astype("category")
+        known = np.isin(departments.cat.categories.astype(str), list(dico_mapping[column]))
+        # The category code -1 (no department) reads the False appended at the end
+        return np.append(known, False)[departments.cat.codes.to_numpy()]
+    return np.isin(values.to_numpy(), list(dico_mapping[column]))
+
+
+# Function returning the bitmask of the invalid codes of each row (the columns absent from the frame are not checked)
+def code_flags(df):
+    flags = np.zeros(len(df), dtype=np.uint16)
+    for column, bit in VALIDITY_BITS.items():
+        if column in df.columns:
+            flags[~valid_rows(df[column], column)] |= bit
+    return flags
+
+
+# Function returning the codes of a column with its invalid codes (read from the bitmask) replaced by MISSING_CODE
+# when they are missing and by OTHER_CODE when they are codes without a label in dico.py (catv 50)
+def fold_invalid(values, flags, column):
+    invalid = (flags & VALIDITY_BITS[column]) != 0
+    if not invalid.any():
+        return values
+    missing = (values.isna() | (values == MISSING_CODE)).to_numpy()
+    return values.where(~invalid, np.where(missing, MISSING_CODE, OTHER_CODE)).astype(values.dtype)
+
+
+# Function returning the quarantine report of a frame : the number of rows of each invalid code of each column
+# (missing : MISSING_CODE or no value, unknown : a code that is not in dico.py)
+def quarantine_report(df):
+    flags = df[INVALID_CODES].to_numpy()
+    rows = []
+    for column, bit in VALIDITY_BITS.items():
+        invalid = (flags & bit) != 0
+        if column not in df.columns or not invalid.any():
+            continue
+        counts = df[column][invalid].astype(str).value_counts(dropna=False)
+        for code, count in counts.items():
+            reason = "missing" if code in (str(MISSING_CODE), "nan", "<NA>") else "unknown"
+            rows.append({"column": column, "code": code, "reason": reason, "rows": int(count)})
+    return pd.DataFrame(rows, columns=["column", "code", "reason", "rows"])
+
+
+# Function to write the quarantine report of a year next to its partition, from the columns of the partition
+def write_quarantine(year, dataset_dir=DATASET_DIR):
+    table = read_year_table(year, list(VALIDATED_COLUMNS) + [INVALID_CODES], dataset_dir)
+    report = quarantine_report(table.to_pandas())
+    path = quarantine_path(year, dataset_dir)
+    tmp_path = temporary_path(path)
+    report.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return report
+
+
+# Function returning the path of the quarantine report of a year
+def quarantine_path(year, dataset_dir=DATASET_DIR):
+    return os.path.join(year_dir(year, dataset_dir), QUARANTINE_NAME)
@@ -3,12 +3,25 @@
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
-import plotly.express as px
 import ssl
-from dico import dico_mapping  # Import the dico_mapping from dico.py
+from categories import label_of
+from schema import read_dtypes, apply_schema, MISSING_CODE
+from tracing import traced, span, mark_cache_miss
+from cube import build_cuboid, CUBE_COLUMNS
+from panels import compute_panels, required_cuboids, department_summary, departments_in_range, DEPARTMENT_MEASURES, PANELS
+from filter_index import build_filter_index, select_positions, FILTER_DIMENSIONS
+from kpis import build_kpi_columns, compute_kpis
+from validation import code_flags, INVALID_CODES
+from timecube import build_time_cube, undated_count, TIME_COLUMNS, TIME_DIMENSIONS
+from grid import build_grid, grid_cells, map_points, GRID_RESOLUTIONS, DEFAULT_RESOLUTION
+from store import read_dataset, dataset_versions, available_years, CSV_PATH
+from refresh import start_worker, served_dataset, served_version, version_label, MAX_SELECTIONS
+from api import start_server, PORT_VARIABLE
+from exports import build_export, export_path, EXPORT_FORMATS
+from result_cache import cached_result, cache_stats, filter_key, parse_filters, parse_filter_key, record_view, popular_views
+import os
 import time
-import sys
-import datetime
+import functools
 
 
 # Data source : data.gouv.fr
@@ -38,19 +51,221 @@ def include_custom_styles():
         st.error("The 'style.css' file could not be found. Please make sure it exists in the same directory as your Python script.")
 
 
+# Columns used by the row-level Key numbers and the summary of the departments (column projection when loading
+# the data), with the dimensions of the filter index that selects their rows
+# The other panels read cuboids, built from CUBE_COLUMNS, or the time cube, built from TIME_COLUMNS
+PANEL_COLUMNS = {
+    "statistics": ("Num_Acc", "grav", "an_nais", "dep") + FILTER_DIMENSIONS,
+    "map": ("Num_Acc", "grav", "lat", "long"),
+}
+
+# Filter state of the page kept in the URL query parameters (?catr=3&lum=1&catu=2) : parameter -> key of its widget
+FILTER_WIDGETS = {"catr": "catr_filter", "lum": "lum_filter", "catu": "catu", "dep_min": "dep_min", "dep_max": "dep_max"}
+
+# Views warmed at each refresh (warm_caches) : the filter keys of this environment variable and the most viewed ones
+WARM_VIEWS_VARIABLE = "ACCIDENTS_WARM_VIEWS"
+WARM_POPULAR_VIEWS = 8
+
+# Dataset versions kept by the loaders below : the served version and the previous one of each warmed year selection.
+# The least recently used versions are evicted with their frames, cubes and indexes (and the mapping of their files)
+DATASET_CACHE_ENTRIES = 2 * (MAX_SELECTIONS + 1)
+# The frames are kept per column projection (statistics, map, cube, time cube) and the cuboids per dimensions
+DATA_CACHE_ENTRIES = 4 * DATASET_CACHE_ENTRIES
+CUBOID_CACHE_ENTRIES = 32 * DATASET_CACHE_ENTRIES
+
+
 # Function to load data
 # Use the @st.cache decorator to cache the data loading and pre-processing
-@st.cache_data
-def load_data():
-    accidents = pd.read_csv("accidents.csv", delimiter=',', low_memory=False)
-    return accidents
+# Only the selected years and the requested columns are read from the dataset written by clean_db.py
+# The dataset key (years + version of their files) is the cache key, so a rebuilt year is read again
+# The span of each call is written to the trace file (tracing.py), the calls that do not run the body are cache hits
+# st.cache_resource returns the same frame to every session instead of a copy, and its columns are views of the
+# shared copy of the dataset mapped into memory (store.py) : the frame is read-only for its users
+@traced(cached=True)
+@st.cache_resource(max_entries=DATA_CACHE_ENTRIES)
+def load_data(columns, dataset):
+    mark_cache_miss()
+    if dataset.years:
+        accidents = read_dataset(dataset.years, columns, versions=dataset_versions(dataset))
+    else:
+        # Fall back to the CSV file if the Parquet file has not been built yet
+        # It has no bitmask of the invalid codes : the codes are validated here (validation.py)
+        usecols = [column for column in columns if column != INVALID_CODES] if columns is not None else None
+        # An accidents.csv written before the time buckets has no weekday / hour : its accidents are undated
+        header = pd.read_csv(CSV_PATH, delimiter=',', nrows=0).columns
+        undated = [column for column in ("weekday", "hour") if column in (usecols or []) and column not in header]
+        usecols = [column for column in usecols if column not in undated] if usecols is not None else None
+        accidents = pd.read_csv(CSV_PATH, delimiter=',', low_memory=False, usecols=usecols, dtype=read_dtypes(usecols))
+        accidents[undated] = MISSING_CODE
+        accidents[INVALID_CODES] = code_flags(accidents)
+    # The coded columns are kept as compact integer codes (schema.py), the labels of dico.py are attached after aggregation
+    return apply_schema(accidents)
+
+
+# Function to build the time cube (accidents per month x weekday x hour) once per dataset version (timecube.py)
+@traced(cached=True)
+@st.cache_resource(max_entries=DATASET_CACHE_ENTRIES)
+def load_time_cube(dataset):
+    mark_cache_miss()
+    return build_time_cube(load_data(TIME_COLUMNS, dataset))
+
+
+# Function to build the filter index of the row-level Key numbers once per dataset version (filter_index.py)
+@traced(cached=True)
+@st.cache_resource(max_entries=DATASET_CACHE_ENTRIES)
+def load_filter_index(dataset):
+    mark_cache_miss()
+    return build_filter_index(load_data(PANEL_COLUMNS["statistics"], dataset))
+
+
+# Function to prepare the columns of the KPI engine once per dataset version (kpis.py)
+@traced(cached=True)
+@st.cache_resource(max_entries=DATASET_CACHE_ENTRIES)
+def load_kpi_columns(dataset):
+    mark_cache_miss()
+    return build_kpi_columns(load_data(PANEL_COLUMNS["statistics"], dataset))
+
+
+# Function to compute the Key numbers of the rows selected by the filters of the sidebar
+# The result (a few numbers) is kept in the result cache shared by the sessions, per dataset version and filter key
+@traced(cached=True)
+def load_kpis(dataset, catr_filter, lum_filter):
+    filters = {'catr': catr_filter, 'lum': lum_filter}
+
+    def compute():
+        mark_cache_miss()
+        return compute_kpis(load_kpi_columns(dataset), select_positions(load_filter_index(dataset), filters))
+
+    return cached_result("kpis", (dataset, filter_key(filters)), compute)
+
+
+# Function to compute the number of accidents and people of each department once per dataset version
+@traced(cached=True)
+@st.cache_data(max_entries=DATASET_CACHE_ENTRIES)
+def load_department_summary(dataset):
+    mark_cache_miss()
+    accidents = load_data(PANEL_COLUMNS["statistics"], dataset)
+    return department_summary(accidents['Num_Acc'].to_numpy(), accidents['dep'])
+
+
+# Function to build the grid of the accident map once per dataset version (grid.py)
+@traced(cached=True)
+@st.cache_resource(max_entries=DATASET_CACHE_ENTRIES)
+def load_map_grid(dataset):
+    mark_cache_miss()
+    return build_grid(load_data(PANEL_COLUMNS["map"], dataset))
+
+
+# Function to compute the cells of the map at one resolution for the filters of the sidebar
+# The result (one row per non-empty cell) is kept in the result cache, per dataset version, resolution and filter key
+@traced(cached=True)
+def load_map_cells(dataset, resolution, catr_filter, lum_filter):
+    filters = {'catr': catr_filter, 'lum': lum_filter}
+
+    def compute():
+        mark_cache_miss()
+        return grid_cells(load_map_grid(dataset), resolution, select_positions(load_filter_index(dataset), filters))
+
+    return cached_result("map", (dataset, resolution, filter_key(filters)), compute)
+
+
+# Function to get a cuboid (counts over a few dimensions), computed from the row-level frame once per dataset version
+@traced(cached=True)
+@st.cache_data(max_entries=CUBOID_CACHE_ENTRIES)
+def load_cuboid(dimensions, dataset):
+    mark_cache_miss()
+    return build_cuboid(load_data(CUBE_COLUMNS, dataset), dimensions)
+
+
+# Function returning what a panel reads for the dimensions of PANELS : the time cube or a cuboid
+def load_panel_source(dimensions, dataset):
+    return load_time_cube(dataset) if dimensions == TIME_DIMENSIONS else load_cuboid(dimensions, dataset)
+
+
+# Function to compute the results of a view of the dashboard (filters of the sidebar) into the result cache
+def warm_view(dataset, catr_filter, lum_filter):
+    filters = {'catr': catr_filter, 'lum': lum_filter}
+    load_kpis(dataset, catr_filter, lum_filter)
+    compute_dashboard(dataset, filters, tuple(name for name in PANELS if name != "gravity"))
+    compute_dashboard(dataset, {**filters, 'catu': usager_types(dataset)[0]}, ("gravity",))
+    if dataset.years:
+        load_map_cells(dataset, DEFAULT_RESOLUTION, catr_filter, lum_filter)
+
+
+# Function to build all the caches of a dataset version (called by the refresh worker before the switch)
+# The views warmed are the unfiltered page, the filter keys of the ACCIDENTS_WARM_VIEWS environment variable
+# ("catr=3 catr=4&lum=1") and the most viewed filter states of the server
+def warm_caches(dataset):
+    load_filter_index(dataset)
+    load_kpi_columns(dataset)
+    load_department_summary(dataset)
+    # The cuboids (and the time cube) of the panels and the codes of the filters of the sidebar
+    for dimensions in required_cuboids() | {("catr",), ("lum",)}:
+        load_panel_source(dimensions, dataset)
+    views = ["", *os.environ.get(WARM_VIEWS_VARIABLE, "").split(), *popular_views(WARM_POPULAR_VIEWS)]
+    for key in dict.fromkeys(views):
+        filters = parse_filter_key(key)
+        warm_view(dataset, filters.get('catr'), filters.get('lum'))
+
+
+# Function to start the refresh worker of the server (refresh.py), once per process
+# It rebuilds the dataset and warms the caches of the new version when the source files or the cleaned output change
+@st.cache_resource
+def start_refresh():
+    return start_worker(warm_caches)
 
 
-# Function to map old/new values from a dictionary to each column of the dataset  
-@st.cache_data
-def replacement(df, dicoRemplacement):
-    df_new = df.replace(dicoRemplacement)
-    return df_new 
+# Function to start the query service of api.py in the server (same cuboids and caches as the panels), once per process
+@st.cache_resource
+def start_api(port):
+    return start_server(load_cuboid, port)
+
+
+# Function to choose the years of the dataset to explore (only these years are loaded)
+def select_years():
+    years = available_years()
+    if not years:
+        # The dataset has not been built yet : the dashboard reads accidents.csv
+        return served_dataset([])
+    selected_years = st.sidebar.multiselect("Years", years, default=years[-1:])
+    # The version served by the refresh worker, whose caches are already built
+    return served_dataset(selected_years or years[-1:])
+
+
+# Function to display the version of the dataset and the duration of its last build in the sidebar
+def display_dataset_version(dataset):
+    served = served_version()
+    if served is None or dataset not in served.datasets.values():
+        st.sidebar.caption(f"Dataset version {version_label(dataset)}")
+    else:
+        st.sidebar.caption(f"Dataset version {version_label(dataset)} - built in {served.build_seconds:.1f} s "
+                           f"at {served.built_at:%H:%M:%S}")
+
+
+# Function to propose the export of the dataset, with or without the active filters of the sidebar (exports.py)
+# An export is built once per dataset version and filters into the exports directory, then served from this file
+# The download button reads the whole file, so it is only shown after the "Prepare the export" action of the session
+# (kept in session_state until the file is downloaded), not on every rerun of the page
+@traced()
+def export_data(dataset, filters):
+    if not dataset.years:
+        return
+    st.sidebar.title("Export")
+    export_format = st.sidebar.radio("Format", list(EXPORT_FORMATS), horizontal=True)
+    extension, mime = EXPORT_FORMATS[export_format]
+    if not st.sidebar.checkbox("Only the rows of the active filters"):
+        filters = None
+
+    # The export is only built on demand (the exports already built are read from the exports directory)
+    path = export_path(dataset, extension, filters)
+    if st.sidebar.button("Prepare the export"):
+        st.session_state["prepared_export"] = path
+    if st.session_state.get("prepared_export") == path:
+        path = build_export(dataset, extension, filters)
+        with open(path, "rb") as export_file:
+            st.sidebar.download_button(f"Download {os.path.basename(path)}", data=export_file,
+                                       file_name=os.path.basename(path), mime=mime, key="export",
+                                       on_click=st.session_state.pop, args=("prepared_export", None))
 
 
 # Function to create the sidebar
@@ -73,39 +288,30 @@ def personal_info():
     ''')
 
 
-# Function to display the Key numbers
-def display_statistics(df):
+# Function to display the Key numbers computed by load_kpis
+@traced()
+def display_statistics(kpis):
     st.markdown("## Accident Statistics")
 
     col1, col3, col5 = st.columns(3)
     col2, col4, col6 = st.columns(3)
-    # Column 1: Count of Accidents
-    total_accidents = len(df)
-    col1.metric("Total Accidents", total_accidents)
+    # Column 1: Count of Accidents (distinct Num_Acc, a row is a person involved)
+    col1.metric("Total Accidents", kpis["accidents"], help=f"{kpis['people']} people involved")
 
-    # Column 2: Variance % of Accidents
-    accident_counts = df['Num_Acc'].value_counts()
-    variance = accident_counts.var()
-    rounded_variance = round(variance, 2)
-    col2.metric("Variance % of Accidents", rounded_variance)
+    # Column 2: Variance of the number of people per accident
+    col2.metric("Variance of People per Accident", round(kpis["people_per_accident_variance"], 2))
 
     # Column 3: Count of Deaths
-    sum_deaths = df['grav'].eq(2).sum()  # Gravité 2 corresponds to 'Tué'
-    col3.metric("Total Deaths", sum_deaths)
+    col3.metric("Total Deaths", kpis["deaths"])
 
-    # Column 4: Variance % of Deaths
-    variance_grav = df['grav'].var()
-    rounded_variance_grav = round(variance_grav, 2)
-    col4.metric("Variance % of Deaths", rounded_variance_grav)
+    # Column 4: Variance of the gravity codes
+    col4.metric("Variance of Gravity", round(kpis["gravity_variance"], 2))
 
-    # Column 5: Average Age
-    average_age = df['an_nais'].mean()
-    col5.metric("Average Age", round(average_age, 2))
+    # Column 5: Average Age at the time of the accident
+    col5.metric("Average Age", round(kpis["mean_age"], 2))
 
-    # Column 6: Percentage of Deaths
-    total_accidents = len(df)
-    percentage_deaths = round((sum_deaths / total_accidents) * 100, 2)
-    col6.metric("Percentage of Deaths", f"{percentage_deaths}%")
+    # Column 6: Percentage of Deaths among the people involved
+    col6.metric("Percentage of Deaths", f"{round(kpis['death_rate'], 2)}%")
 
 
 # Function that gives the user the ability to change the grouping variable(s)
@@ -145,227 +351,260 @@ def init_SelectionsLabels(df, grouping_keys):
         )
 
 
-# Function filtered by condition of road
-def plot_accidents_by_cond_road(data):
-    custom_colors1 = ["#FF5733", "#33FF57"]
-    custom_colors2 = [ "#7791EF", "#DD77EF"]
-    custom_colors3 = ["#DAF7A6", "#FFC300"]
+# Function to restore the filter state of the URL query parameters into the widgets, on the first run of a session
+# A link to the dashboard with ?catr=3&lum=1 opens the same view
+def restore_filters():
+    if st.session_state.get("filters_restored"):
+        return
+    st.session_state["filters_restored"] = True
+    for name, value in parse_filters(st.query_params.to_dict()).items():
+        st.session_state[FILTER_WIDGETS[name]] = value
+
+
+# Function to write a part of the filter state into the URL query parameters (None : default value, not in the URL)
+# The parameters are rewritten in the order of the canonical key only when the state changed
+def update_url(filters):
+    current = parse_filters(st.query_params.to_dict())
+    state = {**current, **filters}
+    if filter_key(state) != filter_key(current):
+        st.query_params.from_dict({name: str(value) for name, value in parse_filter_key(filter_key(state)).items()})
+
+
+# Function to drop the value of a widget from the session state if it is not one of its options (a URL of an other dataset)
+def check_option(key, options):
+    if key in st.session_state and st.session_state[key] not in options:
+        del st.session_state[key]
+
+
+# Function to bring the value of a slider of the session state into its interval
+def clamp_state(key, low, high):
+    if key in st.session_state:
+        st.session_state[key] = min(max(st.session_state[key], low), high)
+
+
+# Function to display the hit rate of the result cache shared by the sessions in the sidebar
+def display_cache_stats():
+    stats = cache_stats()
+    hits = sum(kind["hits"] for kind in stats["kinds"].values())
+    lookups = hits + sum(kind["misses"] for kind in stats["kinds"].values())
+    if lookups:
+        st.sidebar.caption(f"Result cache : {hits / lookups:.0%} hits ({stats['size']} results shared by the sessions)")
+
+
+# Function to choose a filter of the sidebar in a form : the filter is applied when the button is clicked,
+# then kept in the session state (key of the select box) until another value is applied ("All" removes it)
+# Returns the code of the applied filter (None if no filter is applied)
+def select_filter(dimension, label, codes):
+    check_option(f"{dimension}_filter", [None] + codes)
+    with st.sidebar.form(f"{dimension}_form"):
+        selected = st.selectbox(label, [None] + codes, key=f"{dimension}_filter",
+                                format_func=lambda code: "All" if code is None else label_of(code, dimension))
+        st.form_submit_button("Apply Filter")
+    return selected
+
+
+# Function to choose the category of road in the sidebar
+def select_road_category(dataset):
     st.sidebar.title("Filter Options")
-    selected_catr = st.sidebar.selectbox("Select Category of Road", data['catr'].unique())
-    apply_filter = st.sidebar.button("Apply Filter", key="catr")
+    catr_codes = sorted(load_cuboid(("catr",), dataset)['catr'])
+    return select_filter('catr', "Select Category of Road", catr_codes)
 
-    if apply_filter:
-        filtered_data = data[data['catr'] == selected_catr]
-    else:
-        # Use the unfiltered data if the button is not clicked
-        filtered_data = data
 
-    # Create the 'age' column
-    current_year = datetime.datetime.now().year
-    filtered_data['an_nais'] = filtered_data['an_nais'].fillna(0).astype(int)
-    filtered_data['age'] = current_year - filtered_data['an_nais']
+# Function to choose the luminosity in the sidebar
+def select_luminosity(dataset):
+    lum_codes = sorted(code for code in load_cuboid(("lum",), dataset)['lum'] if code != -1)
+    return select_filter('lum', "Select Luminosity", lum_codes)
+
 
+# Function returning the types of usager of the gravity panel
+def usager_types(dataset):
+    return sorted(load_cuboid(("grav", "catu"), dataset)['catu'].unique())
+
+
+# Function computing the panels for the filter spec of the page (all the panels of panels.py by default)
+# The cuboids are read from the cache here, then the panels are computed (panels.py)
+# The results (aggregates and figures) are kept in the result cache shared by the sessions, per dataset version and filter key
+@traced(cached=True)
+def compute_dashboard(dataset, filters, names=tuple(PANELS)):
+    def compute():
+        mark_cache_miss()
+        cuboids = {dimensions: load_panel_source(dimensions, dataset) for dimensions in required_cuboids(names)}
+        return compute_panels(cuboids, filters, names)
+
+    return cached_result("panels", (dataset, names, filter_key(filters)), compute)
+
+
+# Function filtered by condition of road
+@traced()
+def plot_accidents_by_cond_road(results):
     c1, c2 = st.columns((6, 5))
     with c1:
         # Monthly accidents over the year
-        months_order = ["Janvier", "Février", "Mars", "Avril", "Mai", "Juin", "Juillet", "Août", "Septembre", "Octobre", "Novembre", "Décembre"]
-        data['mois'] = filtered_data['mois'].astype(str)
-        monthly_data = filtered_data['Num_Acc'].groupby(filtered_data['mois']).count()
-        monthly_data = monthly_data.reindex(months_order)
-
-        fig = px.line(x=months_order, 
-            y=monthly_data, 
-            markers=True, 
-            labels={'x': 'Month', 'y': 'Number of Accidents'}, 
-            title='Monthly Accidents',
-            color_discrete_sequence=custom_colors3)
-        st.plotly_chart(fig)
+        st.plotly_chart(results["monthly"].figure)
 
     with c2:
-        # Accidents inside / outside agglomeration
-        agg_data = filtered_data['agg'].value_counts().reset_index()
-        agg_data.columns = ['Agglomeration', 'Count']
-
-        # Create a donut chart using Plotly Express
-        fig = px.pie(agg_data, 
-            names='Agglomeration', 
-            values='Count',
-            color_discrete_sequence=custom_colors2, 
-            hole=0.4, 
-            title='Accidents Inside/Outside Agglomeration')
-        st.plotly_chart(fig)
+        # Accidents inside / outside agglomeration (donut chart)
+        st.plotly_chart(results["agglomeration"].figure)
 
     c3, c4 = st.columns((4, 3))
     with c3:
         # Accidents by category of vehicle
-        vehicle_type_counts = filtered_data['catv'].value_counts()
-        total_accidents = len(filtered_data)
-        vehicle_type_percentages = (vehicle_type_counts / total_accidents) * 100
-
-        vehicle_type_data = pd.DataFrame({
-            "Vehicle Type": vehicle_type_percentages.index,
-            "Percentage": vehicle_type_percentages.values
-        })
-
-        fig = px.bar(
-            vehicle_type_data,
-            x="Percentage",
-            y="Vehicle Type",
-            color_discrete_sequence=custom_colors1,
-            title=f"Accidents by Vehicle Type (%) - Category of Road: {selected_catr}",
-            labels={"Vehicle Type": "Type de véhicule", "Percentage": "Percentage of accidents (%)"}
-        )
-        st.plotly_chart(fig)
+        st.plotly_chart(results["vehicle_type"].figure)
 
     with c4:
-        # Calculate the age of individuals involved in accidents
+        # Count of individuals involved in accidents by gender and age bucket (5 years)
+        st.plotly_chart(results["gender_age"].figure)
+
 
-        # Filter out rows with "sexe" equal to -1
-        data_filtered = filtered_data[filtered_data['sexe'] != -1]
+# Function computing the departments by accident range panel : the departments whose count of the measure
+# ("Accidents" or "People") is in [low, high], from the per-department summary of load_department_summary
+# The compute of the panels of the fragments is kept out of the fragments : it also runs without a script run context
+# (benchmarks/bench_dashboard.py)
+@traced("viz.departments")
+def departments_panel(dataset, measure, low, high):
+    return departments_in_range(load_department_summary(dataset)[DEPARTMENT_MEASURES[measure]], low, high)
 
-        # Group the filtered data by 'sexe' and 'age' and count the number of accidents
-        grouped_data = data_filtered.groupby(['sexe', 'age']).size().reset_index(name='Count of accidents')
 
-        # Create a Streamlit bar chart to visualize the data
-        st.markdown("###### Count of Accidents by Gender and Age")
-        st.bar_chart(grouped_data, x='sexe', y='Count of accidents')
+# Function computing the map panel : the cells of the grid at one resolution and their points (grid.py)
+def map_panel(dataset, resolution, catr_filter, lum_filter):
+    with span("viz.map") as record:
+        cells = load_map_cells(dataset, resolution, catr_filter, lum_filter)
+        record["rows"] = len(cells)
+        return cells, map_points(cells, resolution)
+
+
+# Function computing the gravity panel for one usager type : the frame of its bar chart
+@traced("viz.gravity")
+def gravity_panel(dataset, filters, usager):
+    return compute_dashboard(dataset, {**filters, 'catu': usager}, ("gravity",))["gravity"].figure
 
 
 # Function to display departments by accident range (st.bar_chart)
-def display_departments_by_accident_range(df):
+# The panel is a fragment : its radio and sliders only rerun this function, not the whole page
+# summary is the per-department summary of load_department_summary (one row per department)
+@st.fragment
+@traced()
+def display_departments_by_accident_range(dataset):
     st.markdown("## Departments by Accident Range")
+    summary = load_department_summary(dataset)
 
-    # Check if the 'total_accidents' column exists, and if not, create it
-    if 'total_accidents' not in df.columns:
-        df['total_accidents'] = df.groupby('dep')['Num_Acc'].transform('count')
+    # Count the distinct accidents or the people involved of each department
+    measure = st.radio("Count", list(DEPARTMENT_MEASURES), horizontal=True)
+    dep_counts = summary[DEPARTMENT_MEASURES[measure]]
     
-    total_accidents = df['total_accidents'].max()  # Calculate the max value for the slider
+    total_accidents = int(dep_counts.iloc[-1])  # The counts are sorted : the last one is the max value for the slider
     
-    # Use two sliders to allow the user to choose an interval
+    # Use two sliders to allow the user to choose an interval (kept in the URL)
     st.markdown("#### Select an interval of accidents")
-    min_accidents = st.slider("Minimum number of accidents", min_value=0, max_value=total_accidents)
-    max_accidents = st.slider("Maximum number of accidents", min_value=min_accidents, max_value=total_accidents)
+    clamp_state("dep_min", 0, total_accidents)
+    min_accidents = st.slider("Minimum number of accidents", min_value=0, max_value=total_accidents, key="dep_min")
+    clamp_state("dep_max", min_accidents, total_accidents)
+    max_accidents = st.slider("Maximum number of accidents", min_value=min_accidents, max_value=total_accidents,
+                              key="dep_max")
+    update_url({"dep_min": min_accidents or None, "dep_max": max_accidents if max_accidents != min_accidents else None})
 
-    # Filter departments based on the chosen interval
-    filtered_departments = df[(df['total_accidents'] >= min_accidents) & (df['total_accidents'] <= max_accidents)]
+    # Find the departments of the chosen interval (binary search on the sorted counts)
+    filtered_departments = departments_panel(dataset, measure, min_accidents, max_accidents)
 
     if not filtered_departments.empty:
         # Display the corresponding departments
-        st.write(f"Departments with a total of accidents between {min_accidents} and {max_accidents}:")
-        # Create a bar chart to display the data
-        chart_data = filtered_departments[['dep', 'total_accidents']]
-        st.bar_chart(chart_data.set_index('dep'))
+        st.write(f"Departments with a total of {measure.lower()} between {min_accidents} and {max_accidents}:")
+        # Create a bar chart to display the data (one bar per department)
+        st.bar_chart(filtered_departments.rename(f"total_{DEPARTMENT_MEASURES[measure]}"))
+
+
+# Function to display the map of the accidents (st.map) : one point per cell of the grid, its size is the number
+# of accidents of the cell and its color the share of people killed or hospitalized (from yellow to red)
+# The panel is a fragment : a change of resolution only reruns this function
+@st.fragment
+@traced()
+def display_accident_map(dataset, catr_filter, lum_filter):
+    st.markdown("## Map of the Accidents")
+    if not dataset.years:
+        # accidents.csv has no coordinates : the map needs the dataset built by ingest.py
+        st.info("The map is available once the dataset is built (python clean_db.py --years 2022)")
+        return
+
+    resolution = st.select_slider("Resolution of the map", list(GRID_RESOLUTIONS), value=DEFAULT_RESOLUTION)
+    cells, points = map_panel(dataset, resolution, catr_filter, lum_filter)
+    st.map(points, latitude="lat", longitude="lon", size="size", color="color")
+    st.caption(f"{int(cells['accidents'].sum())} accidents in {len(cells)} cells of {GRID_RESOLUTIONS[resolution]}° "
+               f"- size : number of accidents, color : share of people killed or hospitalized")
 
 
 # Function to display accidents by gravity and usagers (st.bar_chart)
-def plot_accidents_by_gravity_and_usager(data):
-    data_filtered = data[data['grav'] != -1]
-    grouped_data = data_filtered.groupby(['grav', 'catu']).size().reset_index(name='count')
+# The panel is a fragment : a change of usager type only recomputes and redraws the gravity panel
+@st.fragment
+@traced()
+def plot_accidents_by_gravity_and_usager(dataset, filters):
     st.markdown("## Accidents by Gravity and Usager Type")
 
-    # Create a selectbox to choose the type d'usager (catu)
-    usager_types = data['catu'].unique()
-    selected_usager = st.selectbox("Select Usager Type:", usager_types)
-
-    # Filter the data based on the selected usager
-    filtered_data = grouped_data[grouped_data['catu'] == selected_usager]
+    # Create a selectbox to choose the type d'usager (catu, kept in the URL), then compute the panel for its value
+    usager_codes = usager_types(dataset)
+    check_option("catu", usager_codes)
+    selected_usager = st.selectbox("Select Usager Type:", usager_codes, key="catu",
+                                   format_func=lambda code: label_of(code, 'catu'))
+    update_url({"catu": selected_usager if selected_usager != usager_codes[0] else None})
+    chart = gravity_panel(dataset, filters, selected_usager)
 
     # Create a Streamlit bar chart to visualize the data
-    st.bar_chart(filtered_data, x='grav', y='count', use_container_width=True)
+    st.bar_chart(chart, x='grav', y='count', use_container_width=True)
 
 
 # Function filtered by luminosity
-def plot_accidents_by_luminosity(data):
-    custom_colors1 = ["#FF5733", "#33FF57"]
-    custom_colors2 = [ "#7791EF", "#DD77EF"]
-    custom_colors3 = ["#DAF7A6", "#FFC300"]
-
-    filtered_data = data[(data['lum'] != -1)]
-    selected_luminosity = st.sidebar.selectbox("Select Luminosity", filtered_data['lum'].unique())
-    apply_filter = st.sidebar.button("Apply Filter", key="lum")
-
-    if apply_filter:
-        filtered_data = data[data['lum'] == selected_luminosity]
-    else:
-        # Use the unfiltered data if the button is not clicked
-        filtered_data = data
-
+@traced()
+def plot_accidents_by_luminosity(results):
     c1, c2 = st.columns((4, 3))
     with c1:
         # atmospheric conditions
-        accidents_by_atm = filtered_data['Num_Acc'].groupby(filtered_data['atm']).count().reset_index()
-        accidents_by_atm.columns = ['Conditions Atmosphériques', 'Number of Accidents']
-
-        fig = px.histogram(
-            accidents_by_atm,
-            x='Conditions Atmosphériques',
-            y='Number of Accidents',
-            color_discrete_sequence=custom_colors2,
-            labels={'Conditions Atmosphériques': 'Weather Conditions', 'Number of Accidents': 'Number of Accidents'},
-            title='Number of Accidents by Weather Conditions'
-        )
-
-        st.plotly_chart(fig)
+        st.plotly_chart(results["weather"].figure)
     
     with c2:
         # Route type
-        data_filtered = filtered_data[(filtered_data['trajet'] != -1) & (filtered_data['trajet'] != 0)]
-        accidents_by_trajet = filtered_data['Num_Acc'].groupby(data_filtered['trajet']).count().reset_index()
-        accidents_by_trajet.columns = ['Route type', 'Number of Accidents']
-
-        fig = px.histogram(
-            accidents_by_trajet,
-            x='Route type',
-            y='Number of Accidents',
-            color_discrete_sequence=custom_colors3,
-            labels={'Route type': 'Route type', 'Number of Accidents': 'Number of Accidents'},
-            title='Number of Accidents by Route type'
-        )
+        st.plotly_chart(results["trajet"].figure)
+
+
+# Function displaying the accidents by time of day (heatmap hour x weekday and trend over the hours, from the time cube)
+# The accidents without a valid date or hour are not in the charts, their number is given under the heatmap
+@traced()
+def plot_accidents_by_time(results, dataset, filters):
+    st.markdown("## Accidents by Time of Day")
+    undated = undated_count(load_time_cube(dataset), filters)
+    if undated and not results["hourly"].data["Number of Accidents"].any():
+        # accidents.csv written before the time buckets of ingest.py : no weekday / hour to draw
+        st.info(f"The data has no time buckets (weekday, hour) for its {undated} accidents : they are shown "
+                "by time of day once the dataset is built (python clean_db.py --years 2022)")
+        return
 
-        st.plotly_chart(fig)
+    c1, c2 = st.columns((4, 3))
+    with c1:
+        # Heatmap of the accidents by weekday and hour
+        st.plotly_chart(results["hour_weekday"].figure)
+        if undated:
+            st.caption(f"{undated} accidents without a valid date or hour")
+
+    with c2:
+        # Accidents by hour of the day
+        st.plotly_chart(results["hourly"].figure)
 
 
-# Function to measure execution time
+# Decorator to display the execution time of a function at the bottom of the page
 def measure_execution_time(func):
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.time()
+        start_time = time.perf_counter()
         result = func(*args, **kwargs)
-        end_time = time.time()
+        end_time = time.perf_counter()
         st.text(f"Execution Time: {end_time - start_time:.2f} seconds")
         return result
     return wrapper
 
 
-# Decorator function to measure execution time and log to a file
-def log_execution_time_to_file(log_filename):
-    def decorator(func):
-        def wrapper(*args, **kwargs):
-            # Get the current timestamp
-            timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-
-            # Measure the execution time
-            start_time = time.time()
-            result = func(*args, **kwargs)
-            end_time = time.time()
-
-            # Calculate the execution time in seconds
-            execution_time = end_time - start_time
-
-            # Log the execution time and timestamp to a file
-            with open(log_filename, "a") as log_file:
-                log_file.write(f"Timestamp: {timestamp}, Execution Time: {execution_time:.2f} seconds\n")
-
-            return result
-
-        return wrapper
-
-    return decorator
-
-
-
 # Main function to run the Streamlit app
-# Usage of the decorator
-@log_execution_time_to_file("execution_logs.txt")
+# Each rerun is one "main" span of the trace file, with the spans of the loading steps and the panels inside it
+# (python tracing.py report prints the p50 / p95 / p99 of each span)
+@measure_execution_time
+@traced("main")
 def main():
     # set Streamlit page configuration
     set_streamlit_page_config()
@@ -376,14 +615,30 @@ def main():
     # create sidebar
     create_sidebar()
 
-    # load dataset
-    accidents = load_data() 
+    # start the refresh worker when the app runs in a Streamlit server
+    if st.runtime.exists():
+        start_refresh()
+        # the query service is started when the ACCIDENTS_API_PORT environment variable is set
+        if os.environ.get(PORT_VARIABLE):
+            start_api(int(os.environ[PORT_VARIABLE]))
+
+    # choose the dataset (the data, the cuboids and the indexes are loaded once per dataset version)
+    dataset = select_years()
+    display_dataset_version(dataset)
 
-    # display Key numbers
-    display_statistics(accidents)
+    # read the filters of the sidebar (restored from the URL on the first run, then written to the URL)
+    restore_filters()
+    catr_filter = select_road_category(dataset)
+    lum_filter = select_luminosity(dataset)
+    filters = {'catr': catr_filter, 'lum': lum_filter}
+    update_url(filters)
+    record_view(filter_key(filters))
 
-    # values mapping from an external dictionnary 
-    accidents = replacement(accidents, dico_mapping)  
+    # propose the export of the dataset (with or without these filters)
+    export_data(dataset, filters)
+
+    # display Key numbers of the rows selected by the filters (one pass of the KPI engine, cached per filter set)
+    display_statistics(load_kpis(dataset, catr_filter, lum_filter))
 
     # propose 1 or 2 grouping to be done
     #final_group_keys = init_groupings(accidents)
@@ -391,26 +646,36 @@ def main():
     # init the corresponding multiselect levels
     #init_SelectionsLabels(accidents, final_group_keys)
 
+    # compute all the panels at once (see panels.py)
+    # (the gravity panel is computed by its own fragment, for the selected usager type)
+    results = compute_dashboard(dataset, filters, tuple(name for name in PANELS if name != "gravity"))
+
     # display external chart
-    plot_accidents_by_cond_road(accidents)
+    plot_accidents_by_cond_road(results)
 
     # display of the departments by accident range
-    display_departments_by_accident_range(accidents)
+    display_departments_by_accident_range(dataset)
 
-    # display accidents by gravity and usagers    
-    plot_accidents_by_gravity_and_usager(accidents)
+    # display the map of the accidents (cells of the grid, with the filters of the sidebar)
+    display_accident_map(dataset, catr_filter, lum_filter)
+
+    # display accidents by gravity and usagers
+    plot_accidents_by_gravity_and_usager(dataset, filters)
 
     # display accidents by weather and luminosity
-    plot_accidents_by_luminosity(accidents)
+    plot_accidents_by_luminosity(results)
+
+    # display accidents by weekday and hour of the day (filters of the sidebar)
+    plot_accidents_by_time(results, dataset, filters)
      
     # Create a checkbox to toggle personal info visibility
     show_personal_info = st.sidebar.checkbox("Show Personal Information")
     # Display personal info if the checkbox is checked
     if show_personal_info:
         personal_info()
-    
-    # measure execution time
-    measure_execution_time(main)
+
+    # display the hit rate of the result cache
+    display_cache_stats()
 
 
 if __name__ == '__main__':